@@ -1,9 +1,10 @@
 import calendar
 import streamlit as st
+import numpy as np
 import pandas as pd
 import altair as alt
 
-from datetime import date, timedelta
+from datetime import date
 from dateutil import rrule
 
 # Make sure this is the very first Streamlit call for wide layout!
@@ -11,29 +12,25 @@ st.set_page_config(page_title="Su Tüketimi Panosu", layout="wide")
 
 # Import and inject custom CSS styling.
 from style import inject_css, inject_logo
+from loader import load_invoice_index, load_invoices, load_monthly_cube
+from util import cube, interval, perf, table
+
+# Times the script's phases; add ?perf=1 to the URL to see them.
+app_perf = perf.Phases("app")
 
 inject_css()
 
 # -- Data Loading and Preprocessing --
-invoice_df = pd.read_csv(
-    "data/ca_invoice.csv",
-    usecols=[
-        "name",
-        "grass_area",
-        "start_read_date",
-        "end_read_date",
-        "volume",
-        "estimated_volume",
-    ],
-)
-invoice_df["volume"] = invoice_df["volume"].astype(int)
-invoice_df["difference"] = invoice_df["volume"] - invoice_df["estimated_volume"]
-
-invoice_df["start_read_date"] = pd.to_datetime(invoice_df["start_read_date"]).dt.date
-invoice_df["end_read_date"] = pd.to_datetime(invoice_df["end_read_date"]).dt.date
-invoice_df = invoice_df[
-    invoice_df["start_read_date"] >= pd.to_datetime("2015-01-01").date()
-]
+app_perf.start("load")
+invoice_df = load_invoices()
+# The park × month cube holds the invoices of the estimated period; earlier ones in
+# the invoice table are left out here as well.
+cube_parks, cube_months, cube_values, cube_grass_area = load_monthly_cube()
+if len(cube_months):
+    invoice_df = invoice_df[invoice_df["start_read_date"] >= cube_months[0]]
+if invoice_df.empty:
+    st.info("Gösterilecek fatura bulunamadı.")
+    st.stop()
 
 min_date = invoice_df["start_read_date"].min()
 max_date = invoice_df["start_read_date"].max()
@@ -55,14 +52,15 @@ def format_month(dt: date) -> str:
 all_months = sorted(month_range(min_date, max_date), reverse=True)
 
 
-def get_month_index(yyyy_mm: str) -> int:
+def get_month_index(yyyy_mm: str, default: int = 0) -> int:
     for i, m in enumerate(all_months):
         if format_month(m) == yyyy_mm:
             return i
-    return 0
+    return default
 
 
 # -- Top Row: Logo and Selection Controls --
+app_perf.start("filter")
 # Create four columns: one narrow for the logo and three for the select boxes.
 col_logo, col1, col2, col3 = st.columns([1, 3, 3, 3])
 
@@ -78,7 +76,8 @@ with col1:
     selected_park = st.selectbox("Park Seçiniz:", unique_parks, index=park_index)
 
 with col2:
-    start_default = get_month_index("2016-01")
+    # The oldest month when the data starts later.
+    start_default = get_month_index("2016-01", default=len(all_months) - 1)
     start_mo = st.selectbox(
         "Başlangıç Ay/Yıl", [format_month(m) for m in all_months], index=start_default
     )
@@ -91,32 +90,38 @@ with col3:
 
 start_year, start_month = map(int, start_mo.split("-"))
 end_year, end_month = map(int, end_mo.split("-"))
-start_filter = date(start_year, start_month, 1)
+start_filter = pd.Timestamp(start_year, start_month, 1)
 end_day = calendar.monthrange(end_year, end_month)[1]
-end_filter = date(end_year, end_month, end_day)
+end_filter = pd.Timestamp(end_year, end_month, end_day)
 
 if start_filter > end_filter:
     st.warning("Başlangıç ayı, bitiş ayından sonra. Tarihler değiştirildi.")
     start_filter, end_filter = end_filter, start_filter
 
 # --- Park bazında filtreleme ---
-if selected_park == "ÇANKAYA":
-    park_df = invoice_df.copy()
-else:
-    park_df = invoice_df[invoice_df["name"] == selected_park]
-
-filtered_df = park_df[
-    (park_df["start_read_date"] >= start_filter)
-    & (park_df["end_read_date"] <= end_filter)
-].copy()
-
-filtered_df["difference_pct"] = (
-    ((filtered_df["difference"] / filtered_df["estimated_volume"]) * 100)
-    .replace([float("inf"), float("-inf")], 0)
-    .fillna(0)
+# Invoices fully inside the selected months, found by binary search in the
+# per-park interval index. start_filter is never before the cube's first month,
+# so every match is also in invoice_df.
+filtered_rows = interval.query_intervals(
+    load_invoice_index(),
+    start_filter,
+    end_filter,
+    how="contained",
+    groups=None if selected_park == "ÇANKAYA" else [selected_park],
 )
+filtered_df = invoice_df.loc[filtered_rows]
 
-display_df = filtered_df.drop(columns=["grass_area"]).rename(
+display_df = filtered_df[
+    [
+        "name",
+        "start_read_date",
+        "end_read_date",
+        "estimated_volume",
+        "volume",
+        "difference",
+        "difference_pct",
+    ]
+].rename(
     columns={
         "name": "Park Adı",
         "start_read_date": "Başlangıç Tarihi",
@@ -127,24 +132,34 @@ display_df = filtered_df.drop(columns=["grass_area"]).rename(
         "difference_pct": "Fark (%)",
     }
 )
-display_df = display_df.sort_values("Bitiş Tarihi", ascending=False)
-
-total_actual = filtered_df["volume"].sum()
-total_estimated = filtered_df["estimated_volume"].sum()
-total_diff = filtered_df["difference"].sum()
-invoice_count = len(filtered_df)
-variance_percent = (total_diff / total_estimated * 100) if total_estimated != 0 else 0
 
+app_perf.start("aggregate")
+# KPIs and the monthly chart are sliced from the precomputed park × month cube;
+# invoices spanning the window edges count with the share of their days inside it.
+window = cube.month_window(cube_months, start_filter, end_filter)
 if selected_park == "ÇANKAYA":
-    unique_parks_all = invoice_df.drop_duplicates(subset="name")
-    grass_area_total = unique_parks_all["grass_area"].sum()
+    park_row = len(cube_parks)
+elif selected_park in cube_parks:
+    park_row = cube_parks.index(selected_park)
 else:
-    unique_park = invoice_df[invoice_df["name"] == selected_park].drop_duplicates(
-        subset="name"
-    )
-    grass_area_total = unique_park["grass_area"].iloc[0] if not unique_park.empty else 0
+    # The cube was written by another run than the invoice table (e.g. with a later
+    # start date), so the park has no monthly figures.
+    park_row = None
+    st.info("Seçilen park için aylık özet verisi yok.")
+
+if park_row is None:
+    window_values = np.zeros_like(cube_values[-1, window])
+    grass_area_total = 0
+else:
+    window_values = cube_values[park_row, window]
+    grass_area_total = cube_grass_area[park_row]
+
+total_actual, total_estimated, invoice_count = window_values.sum(axis=0)
+total_diff = total_actual - total_estimated
+variance_percent = (total_diff / total_estimated * 100) if total_estimated != 0 else 0
 
 # -- Tabs for the Dashboard --
+app_perf.start("render")
 tab1, tab2 = st.tabs(["Genel Bakış", "Faturalar"])
 
 # ---------- TAB 1: Genel Bakış ----------
@@ -152,66 +167,42 @@ with tab1:
     # KPI Metrics in card-styled containers (they pick up the CSS defined above)
     kpi_cols = st.columns(5)
     with kpi_cols[0]:
-        st.metric("Toplam Tüketim (m³)", f"{total_actual:,}", help="Gerçek su tüketimi")
+        st.metric(
+            "Toplam Tüketim (m³)", f"{total_actual:,.0f}", help="Gerçek su tüketimi"
+        )
     with kpi_cols[1]:
         st.metric(
             "Toplam Su İhtiyacı (m³)",
-            f"{total_estimated:,}",
+            f"{total_estimated:,.0f}",
             help="Tahmini su ihtiyacı",
         )
     with kpi_cols[2]:
         st.metric(
-            "Toplam Fark (m³)", f"{total_diff:,}", help=f"{variance_percent:.1f}% sapma"
+            "Toplam Fark (m³)", f"{total_diff:,.0f}", help=f"{variance_percent:.1f}% sapma"
         )
     with kpi_cols[3]:
         st.metric(
             "Toplam Yeşil Alan (m²)",
-            f"{grass_area_total:,}",
+            f"{grass_area_total:,.0f}",
             help="Seçilen parkın toplam yeşil alanı",
         )
     with kpi_cols[4]:
-        st.metric("Fatura Sayısı", f"{invoice_count:,}", help="Analiz edilen kayıtlar")
+        st.metric(
+            "Biten Fatura Sayısı",
+            f"{invoice_count:,.0f}",
+            help="Bitiş tarihi seçilen aylarda olan faturalar",
+        )
 
     # Build the Altair time-series chart (its container is styled as a card)
-    chart_df = filtered_df.copy()
-    chart_df["start_read_date"] = pd.to_datetime(chart_df["start_read_date"])
-    chart_df["end_read_date"] = pd.to_datetime(chart_df["end_read_date"])
-
-    rows = []
-    for _, row in chart_df.iterrows():
-        start = row["start_read_date"]
-        end = row["end_read_date"]
-        days_in_invoice = (end - start).days + 1
-        if days_in_invoice <= 0:
-            continue
-        daily_actual = row["volume"] / days_in_invoice
-        daily_estimated = row["estimated_volume"] / days_in_invoice
-        current_day = start
-        while current_day <= end:
-            rows.append(
-                {
-                    "date": current_day,
-                    "daily_actual": daily_actual,
-                    "daily_estimated": daily_estimated,
-                }
-            )
-            current_day += timedelta(days=1)
-
-    df_daily = pd.DataFrame(rows)
-    df_by_day = df_daily.groupby("date", as_index=False).agg(
-        {"daily_actual": "sum", "daily_estimated": "sum"}
-    )
-    df_by_day["year_month"] = df_by_day["date"].dt.to_period("M").dt.to_timestamp()
-    df_monthly = (
-        df_by_day.groupby("year_month", as_index=False)
-        .agg({"daily_actual": "sum", "daily_estimated": "sum"})
-        .rename(
-            columns={
-                "daily_actual": "actual_volume",
-                "daily_estimated": "estimated_volume",
-            }
-        )
+    df_monthly = pd.DataFrame(
+        {
+            "year_month": cube_months[window],
+            "actual_volume": window_values[:, 0],
+            "estimated_volume": window_values[:, 1],
+        }
     )
+    # Leave out months no invoice covers.
+    df_monthly = df_monthly[window_values.any(axis=1)]
     df_monthly["month_date"] = df_monthly["year_month"]
 
     df_melted = df_monthly.melt(
@@ -258,7 +249,47 @@ with tab1:
 
 # ---------- TAB 2: Faturalar ----------
 with tab2:
-    styled_df = display_df.style.background_gradient(
-        subset=["Gerçek (m³)", "Tahmin (m³)", "Fark (m³)", "Fark (%)"], cmap="coolwarm"
+    # The table is sorted and paged here; only the visible page is styled and sent
+    # to the browser. Gradient colours are binned once over all filtered rows.
+    gradient_columns = ["Gerçek (m³)", "Tahmin (m³)", "Fark (m³)", "Fark (%)"]
+    sort_col, order_col, size_col, page_col = st.columns([3, 2, 2, 2])
+    with sort_col:
+        sort_column = st.selectbox(
+            "Sırala",
+            list(display_df.columns),
+            index=display_df.columns.get_loc("Bitiş Tarihi"),
+        )
+    with order_col:
+        sort_order = st.selectbox("Sıralama Yönü", ["Azalan", "Artan"])
+    with size_col:
+        page_size = st.selectbox("Sayfa Boyutu", [25, 50, 100, 250], index=1)
+    page_total = table.page_count(len(display_df), page_size)
+    with page_col:
+        page = st.number_input("Sayfa", min_value=1, max_value=page_total, value=1)
+
+    page_df, page_styles = table.table_page(
+        display_df,
+        table.sort_positions(display_df, sort_column, ascending=sort_order == "Artan"),
+        page,
+        page_size,
+        gradient_codes=table.gradient_bins(display_df, gradient_columns),
+        palette=table.gradient_palette("coolwarm"),
+    )
+    page_df = page_df.assign(
+        **{
+            "Başlangıç Tarihi": page_df["Başlangıç Tarihi"].dt.date,
+            "Bitiş Tarihi": page_df["Bitiş Tarihi"].dt.date,
+        }
+    )
+    styled_df = page_df.style.apply(
+        lambda _: page_styles, axis=None, subset=gradient_columns
     )
     st.dataframe(styled_df, use_container_width=True, hide_index=True)
+    first_row = (page - 1) * page_size
+    st.caption(
+        f"{len(display_df):,} faturadan {min(first_row + 1, len(display_df)):,}–"
+        f"{min(first_row + page_size, len(display_df)):,} arası gösteriliyor "
+        f"(sayfa {page}/{page_total})."
+    )
+
+perf.show_panel(app_perf.stop())
@@ -0,0 +1,289 @@
+"""
+Benchmarks of the processing and dashboard hot paths.
+
+Runs offline: invoices and park names are synthesized from data/all_invoice.csv
+and data/ca_green_area.xlsx at 1×, 10× and 100× their size, and the weather
+archive is replaced by a deterministic synthetic series.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scales 1 10 --repeat 5 --json bench.json
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import invoice_assessment_processing as processing
+from util import cube, ingest, interval, scenarios, similarity, weather
+
+START_DATE = "2015-01-01"
+END_DATE = "2024-01-10"
+# Weather grid locations per 1× of scale.
+LOCATIONS_PER_SCALE = 10
+
+
+def synthetic_archive(lat, lon, start_date, end_date, variables):
+    """Stands in for weather._fetch_archive with a seasonal series per location."""
+    dates = pd.date_range(start=start_date, end=end_date)
+    day = dates.dayofyear.to_numpy()
+    season = np.sin((day - 80) / 365 * 2 * np.pi)
+    offset = (lat * 7 + lon * 3) % 2
+    daily = {
+        "temperature_2m_max": 18 + 12 * season + offset,
+        "temperature_2m_min": 6 + 10 * season + offset,
+        "windspeed_10m_max": 12 + 3 * np.cos(day / 9),
+        "relative_humidity_2m_max": 70 - 15 * season,
+        "shortwave_radiation_sum": 15 + 10 * season,
+    }
+    df = pd.DataFrame({var: daily[var] for var in variables}, dtype=float)
+    df.insert(0, "date", dates)
+    return df
+
+
+@contextmanager
+def stubbed_weather():
+    """Replaces the Open-Meteo archive with synthetic_archive while active."""
+    fetch_archive = weather._fetch_archive
+    weather._fetch_archive = synthetic_archive
+    try:
+        yield
+    finally:
+        weather._fetch_archive = fetch_archive
+
+
+def base_invoices():
+    """Reads the ÇANKAYA invoices of the export, as the processing pipeline does."""
+    return ingest.read_district_invoices(
+        processing.INVOICE_PATH, "ÇANKAYA", name_prefix="ÇANKAYA BELEDİYESİ"
+    )
+
+
+def synthetic_invoices(base, scale, seed=0):
+    """
+    Replicates the base invoices scale times as distinct parks.
+
+    Every copy gets its own subscriptions and park names, a random grass area and
+    weather location, and an estimated volume around the billed one.
+    """
+    rng = np.random.default_rng(seed)
+    copies = np.repeat(np.arange(scale), len(base))
+    df = pd.concat([base] * scale, ignore_index=True)
+    df["subscription"] = df["subscription"].astype(str) + "-" + copies.astype(str)
+    df["name"] = df["name"] + " " + copies.astype(str)
+
+    park_codes, parks = pd.factorize(df["name"])
+    grass_area = rng.integers(100, 20_000, len(parks))
+    location = rng.integers(0, LOCATIONS_PER_SCALE * scale, len(parks))
+    df["grass_area"] = grass_area[park_codes]
+    df["location"] = location[park_codes]
+    df["volume"] = df["volume"].fillna(0)
+    df["estimated_volume"] = (df["volume"] * rng.uniform(0.5, 1.5, len(df))).round()
+    return df
+
+
+def synthetic_names(names, scale):
+    """Returns scale variants of every name (the name itself first)."""
+    return [
+        name if copy == 0 else f"{name} {copy}" for copy in range(scale) for name in names
+    ]
+
+
+def measure(func, repeat):
+    """
+    Times func and records its peak traced memory.
+
+    Returns:
+      - Tuple (best seconds over repeat runs, peak MiB of one traced run)
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # Traced separately: tracemalloc slows allocation-heavy code down.
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 2**20
+
+
+def benchmark_cases(scale, base, registry_names, invoice_names, cache_dir):
+    """Yields (name, unit, n_items, func) for every benchmark at a scale."""
+    invoices = synthetic_invoices(base, scale)
+    n_locations = LOCATIONS_PER_SCALE * scale
+    dates = pd.date_range(START_DATE, END_DATE)
+    rng = np.random.default_rng(scale)
+    water_need = rng.uniform(0, 0.005, (n_locations, len(dates))).round(4)
+
+    yield (
+        "calculate_total_water",
+        "invoices",
+        len(invoices),
+        lambda: processing.calculate_total_water(invoices, dates, water_need),
+    )
+
+    # Locations spread over Turkey, so each one mostly has a grid cell of its own.
+    lats = rng.uniform(36, 42, n_locations)
+    lons = rng.uniform(26, 45, n_locations)
+    weather.prefetch_grid_weather(lats, lons, START_DATE, END_DATE, cache_dir=cache_dir)
+    grid_weather = weather.fetch_grid_weather(
+        lats, lons, 900, START_DATE, END_DATE, cache_dir=cache_dir
+    )
+    n_cells = grid_weather["tavg"].size
+    yield (
+        "compute_penman_monteith",
+        "location-days",
+        n_cells,
+        lambda: weather.compute_penman_monteith(
+            grid_weather["tavg"],
+            grid_weather["wspd"],
+            grid_weather["rhum"],
+            grid_weather["rad"],
+            grid_weather["elevation"][:, np.newaxis],
+        ),
+    )
+
+    # 11 kc values × 4 seasons × 4 efficiencies.
+    scenario_table = scenarios.scenario_grid(
+        kc=np.round(np.arange(0.5, 1.01, 0.05), 2),
+        season_months=[range(6, 11), range(5, 11), range(4, 11), range(4, 10)],
+        efficiency=(0.7, 0.8, 0.9, 1.0),
+    )
+    et_0 = weather.grid_et0(grid_weather)[grid_weather["location_index"]]
+    scenario_invoices = invoices.assign(score=1.0)
+    yield (
+        "scenario_volumes",
+        "scenario-invoices",
+        len(scenario_table) * len(invoices),
+        lambda: scenarios.scenario_volumes(
+            et_0, grid_weather["dates"], scenario_invoices, scenario_table
+        ),
+    )
+    yield (
+        "estimate_water_needs",
+        "location-days",
+        len(dates) * min(n_locations, 10),
+        lambda: [
+            weather.estimate_water_needs(
+                lat, lon, START_DATE, END_DATE, 1000, elevation=900, cache_dir=cache_dir
+            )
+            for lat, lon in zip(lats[:10], lons[:10])
+        ],
+    )
+
+    registry = synthetic_names(registry_names, scale)
+    invoice = synthetic_names(invoice_names, scale)
+
+    def match(mode):
+        # Clear the memoized vectors so every run fits from scratch.
+        similarity._fit_vectors.cache_clear()
+        similarity.normalize_name.cache_clear()
+        similarity.best_matches(registry, invoice, mode=mode)
+
+    for mode in similarity.MATCH_MODES:
+        yield (
+            f"best_matches[{mode}]",
+            "names",
+            len(registry) + len(invoice),
+            lambda mode=mode: match(mode),
+        )
+
+    yield (
+        "apportion_by_month",
+        "invoices",
+        len(invoices),
+        lambda: interval.apportion_by_month(
+            invoices["start_read_date"],
+            invoices["end_read_date"],
+            invoices[["volume", "estimated_volume"]].to_numpy(),
+        ),
+    )
+    yield (
+        "build_monthly_cube",
+        "invoices",
+        len(invoices),
+        lambda: cube.build_monthly_cube(invoices),
+    )
+
+    cube_df = cube.build_monthly_cube(invoices)
+    parks, months, values, _ = cube.cube_array(cube_df)
+    window = cube.month_window(months, "2018-01-01", "2022-12-31")
+    yield (
+        "monthly_cube_query",
+        "parks",
+        len(parks),
+        # Dashboard KPIs and chart for every park in turn.
+        lambda: [values[row, window].sum(axis=0) for row in range(len(parks) + 1)],
+    )
+
+
+def run(scales, repeat):
+    """Runs every benchmark at every scale and returns one result dict per run."""
+    base = base_invoices()
+    green_area_path = processing.DISTRICTS["ÇANKAYA"]["green_area_path"]
+    registry = processing.read_green_area(green_area_path)
+    registry_names = list(registry["PARK ADI"].unique())
+    invoice_names = list(base["name"].unique())
+
+    results = []
+    with stubbed_weather(), tempfile.TemporaryDirectory() as cache_dir:
+        for scale in scales:
+            for name, unit, n_items, func in benchmark_cases(
+                scale, base, registry_names, invoice_names, cache_dir
+            ):
+                seconds, peak_mib = measure(func, repeat)
+                result = {
+                    "benchmark": name,
+                    "scale": scale,
+                    "items": n_items,
+                    "unit": unit,
+                    "seconds": round(seconds, 6),
+                    "throughput": round(n_items / seconds, 1) if seconds else None,
+                    "peak_mib": round(peak_mib, 2),
+                }
+                results.append(result)
+                print(
+                    f"{name:<26} {scale:>4}× {n_items:>12,} {unit:<14}"
+                    f"{seconds:>10.4f} s {result['throughput'] or 0:>16,.0f} /s"
+                    f"{peak_mib:>10.1f} MiB",
+                    flush=True,
+                )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100],
+        help="Data size multiples (default: 1 10 100)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per benchmark; the best is reported (default: 3)",
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Offline checks of the processing pipeline on the committed data.
+
+Runs without network access: the weather archive is replaced by the synthetic
+series of the benchmarks (or, for the weather client, by a local stub server),
+and every output goes to a temporary directory.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_checks
+    python -m benchmarks.run_checks --only zero_matches failed_district
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import invoice_assessment_processing as processing
+from benchmarks.run_benchmarks import base_invoices, stubbed_weather
+from util import interval, name_index, similarity, storage
+
+
+def district_pipeline(output_dir, settings=None, stages=processing.STAGES):
+    """Runs the ÇANKAYA pipeline with its outputs and name index under output_dir."""
+    config = {
+        **processing.DISTRICTS["ÇANKAYA"],
+        "output_prefix": os.path.join(output_dir, "ca"),
+    }
+    index_dir = name_index.INDEX_DIR
+    name_index.INDEX_DIR = os.path.join(output_dir, "name_match_index")
+    try:
+        with stubbed_weather():
+            return processing.run_pipeline(
+                "ÇANKAYA", config, {"cache_dir": None, **(settings or {})}, stages
+            )
+    finally:
+        name_index.INDEX_DIR = index_dir
+
+
+def check_zero_matches(output_dir):
+    """A threshold no score reaches still writes empty invoice and cube tables."""
+    artifacts = district_pipeline(output_dir, {"score_threshold": 1.5})
+    assert artifacts["matched"].empty
+    assert artifacts["grid_weather"]["tavg"].shape == (
+        0,
+        len(artifacts["grid_weather"]["dates"]),
+    )
+    assert artifacts["assessed"].empty
+
+    invoices = storage.read_table(os.path.join(output_dir, "ca_invoice"))
+    assert invoices.empty and "estimated_volume" in invoices.columns
+    monthly_cube = storage.read_table(os.path.join(output_dir, "ca_monthly_cube"))
+    assert monthly_cube.empty
+
+
+def check_failed_district(output_dir):
+    """A failing district is reported and the other districts are still written."""
+    district_pipeline(output_dir, stages=processing.STAGES[:-2])
+    districts = {
+        "ÇANKAYA": {
+            **processing.DISTRICTS["ÇANKAYA"],
+            "output_prefix": os.path.join(output_dir, "ca"),
+        },
+        # No stage artifacts to read, so its join stage fails.
+        "ETİMESGUT": {
+            **processing.DISTRICTS["ÇANKAYA"],
+            "output_prefix": os.path.join(output_dir, "et"),
+        },
+    }
+    partitioned_path = processing.PARTITIONED_OUTPUT_PATH
+    processing.PARTITIONED_OUTPUT_PATH = os.path.join(output_dir, "invoice_assessment")
+    try:
+        processing.assess_districts(
+            districts, {"cache_dir": None}, stages=processing.STAGES[-2:], max_workers=2
+        )
+    except RuntimeError as error:
+        assert "ETİMESGUT" in str(error) and "ÇANKAYA" not in str(error)
+    else:
+        raise AssertionError("the failing district was not reported")
+    finally:
+        processing.PARTITIONED_OUTPUT_PATH = partitioned_path
+
+    written = os.listdir(os.path.join(output_dir, "invoice_assessment"))
+    assert written == ["district=ÇANKAYA"], written
+
+
+def check_name_index_scores(output_dir):
+    """The name index scores pairs as similarity.best_matches, also for later names."""
+    registry = processing.read_green_area(
+        processing.DISTRICTS["ÇANKAYA"]["green_area_path"]
+    )["PARK ADI"].unique()
+    invoice_names = base_invoices()["name"].unique()
+    overrides_path = os.path.join(output_dir, "overrides.csv")
+
+    for mode in similarity.MATCH_MODES:
+        index_dir = os.path.join(output_dir, mode)
+        # Half of the names first, so the second run has to rescore the stored ones.
+        name_index.match_invoice_names(
+            registry, invoice_names[::2], mode, index_dir, overrides_path
+        )
+        matches = name_index.match_invoice_names(
+            registry, invoice_names, mode, index_dir, overrides_path
+        )
+        expected = similarity.best_matches(list(registry), list(invoice_names), mode)
+
+        compared = expected.merge(matches, on="name_2", suffixes=("", "_index"))
+        assert len(compared) == len(expected), mode
+        # The index keeps the best park of every invoice name, so it never scores an
+        # invoice name below a pair of best_matches, and scores the same pair alike.
+        assert (compared["score_index"] >= compared["score"] - 1e-9).all(), mode
+        same_park = compared["name_1_index"] == compared["name_1"]
+        assert np.allclose(
+            compared.loc[same_park, "score_index"], compared.loc[same_park, "score"]
+        ), mode
+
+
+def check_interval_queries(output_dir):
+    """query_intervals returns the rows of the boolean masks it replaced."""
+    rng = np.random.default_rng(0)
+    first_day = pd.Timestamp("2015-01-01")
+    starts = first_day + pd.to_timedelta(rng.integers(0, 3000, 3000), "D")
+    # Some periods end before they start, as in the invoice export.
+    ends = starts + pd.to_timedelta(rng.integers(-60, 90, len(starts)), "D")
+    parks = rng.choice(["A", "B", "C", "D"], len(starts))
+    index = interval.build_interval_index(starts, ends, groups=parks)
+
+    for _ in range(200):
+        range_start = first_day + pd.Timedelta(days=int(rng.integers(0, 3000)))
+        range_end = range_start + pd.Timedelta(days=int(rng.integers(-10, 400)))
+        groups = None if rng.random() < 0.5 else ["A", "C"]
+        in_groups = np.isin(parks, groups if groups else list("ABCD"))
+        masks = {
+            "overlap": (ends >= range_start) & (starts <= range_end),
+            "contained": (starts >= range_start) & (ends <= range_end),
+        }
+        for how, mask in masks.items():
+            rows = interval.query_intervals(index, range_start, range_end, how, groups)
+            assert np.array_equal(rows, np.flatnonzero(mask & in_groups)), how
+
+
+class StubArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Answers Open-Meteo archive queries with a series derived from the day numbers.
+
+    The first request is refused with 429 and Retry-After: 2. Every request's
+    start date, and the time it arrived, is recorded on the server.
+    """
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.server.requests.append((query["start_date"][0], time.monotonic()))
+        if len(self.server.requests) == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "2")
+            self.end_headers()
+            return
+
+        dates = pd.date_range(query["start_date"][0], query["end_date"][0])
+        days = (dates - pd.Timestamp("2020-01-01")).days.tolist()
+        daily = {"time": dates.strftime("%Y-%m-%d").tolist()}
+        for offset, var in enumerate(query["daily"]):
+            daily[var] = [day + offset for day in days]
+        body = json.dumps({"daily": daily}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Run in a separate interpreter, as weather.ARCHIVE_URL is read when it is imported.
+FETCH_SCRIPT = """
+import json, sys
+from util import weather
+frame = weather.fetch_daily_variables(
+    39.92, 32.85, sys.argv[1], sys.argv[2], cache_dir=sys.argv[3]
+)
+print(json.dumps([weather.ARCHIVE_URL, frame["temperature_2m_max"].tolist()]))
+"""
+
+
+def check_weather_client(output_dir):
+    """WEATHER_ARCHIVE_URL, Retry-After retries and cache hits on a local server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubArchiveHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/archive"
+    cache_dir = os.path.join(output_dir, "weather_cache")
+
+    def fetch(start_date, end_date):
+        result = subprocess.run(
+            [sys.executable, "-c", FETCH_SCRIPT, start_date, end_date, cache_dir],
+            env={**os.environ, "WEATHER_ARCHIVE_URL": url},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        archive_url, values = json.loads(result.stdout)
+        assert archive_url == url, archive_url
+        return values
+
+    try:
+        # 2020 fits in one chunk: refused once, then answered after Retry-After.
+        assert fetch("2020-01-01", "2020-12-31") == list(range(366))
+        assert [start for start, _ in server.requests] == ["2020-01-01"] * 2
+        # Longer than any backoff of the first retry (at most BACKOFF_SECONDS).
+        assert server.requests[1][1] - server.requests[0][1] >= 1.9
+
+        # Cached days are not requested again; only the days after them are.
+        assert fetch("2020-03-01", "2020-03-31") == list(range(60, 91))
+        assert len(server.requests) == 2
+        assert fetch("2020-12-01", "2021-01-31") == list(range(335, 397))
+        assert [start for start, _ in server.requests[2:]] == ["2021-01-01"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+CHECKS = {
+    "zero_matches": check_zero_matches,
+    "failed_district": check_failed_district,
+    "name_index_scores": check_name_index_scores,
+    "interval_queries": check_interval_queries,
+    "weather_client": check_weather_client,
+}
+
+
+def run(names):
+    """Runs the named checks, each in a fresh temporary directory; returns failures."""
+    failures = []
+    for name in names:
+        with tempfile.TemporaryDirectory() as output_dir:
+            try:
+                CHECKS[name](output_dir)
+            except Exception:
+                failures.append(name)
+                print(f"{name:<26} FAIL", flush=True)
+                traceback.print_exc()
+            else:
+                print(f"{name:<26} ok", flush=True)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=list(CHECKS),
+        default=list(CHECKS),
+        help="Checks to run (default: all)",
+    )
+    args = parser.parse_args(argv)
+
+    if run(args.only):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,131 +1,850 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from util import similarity, weather
-
-# Import Cankaya Green Area Sheet
-df_ca_green_area = pd.read_excel("data/ca_green_area.xlsx", sheet_name=0, header=4)
-# Remove "SIRA NO" rows with non-numeric or na values
-df_ca_green_area = df_ca_green_area[
-    pd.to_numeric(df_ca_green_area["SIRA NO"], errors="coerce").notna()
-]
-# Convert "SIRA NO" to integer type
-df_ca_green_area["SIRA NO"] = df_ca_green_area["SIRA NO"].astype(int)
-
-# Import all invoices
-df_invoice = pd.read_csv("data/all_invoice.csv")
-# Get only CANKAYA invoices
-df_ca_invoice = df_invoice[df_invoice.district == "ÇANKAYA"].copy()
-
-# Remove "ÇANKAYA BELEDİYESİ" from the "name" column and strip whitespace
-df_ca_invoice["name"] = (
-    df_ca_invoice["name"].str.replace("ÇANKAYA BELEDİYESİ", "", regex=False).str.strip()
+from util import (
+    cube,
+    green_area,
+    incremental,
+    ingest,
+    interval,
+    irrigation,
+    name_index,
+    perf,
+    scenarios,
+    similarity,
+    storage,
+    weather,
 )
 
-# Strip whitespace from column names
-df_ca_invoice.columns = df_ca_invoice.columns.str.strip()
+INVOICE_PATH = "data/all_invoice.csv"
 
-# Convert date columns to datetime.date
-df_ca_invoice["start_read_date"] = pd.to_datetime(
-    df_ca_invoice["start_read_date"]
-).dt.date
-df_ca_invoice["end_read_date"] = pd.to_datetime(df_ca_invoice["end_read_date"]).dt.date
+# Districts of the invoice export. Each one has its own green-area registry and
+# writes its tables under its output prefix (e.g. data/ca_invoice, with optional
+# data/ca_park_locations.csv, data/ca_name_overrides.csv and
+# data/ca_irrigation_calendar.csv inputs). Parks without a location of their own
+# use the district's central coordinate. A district may set its own "kc" and
+# "season_months", which replace the settings' defaults for its parks.
+DISTRICTS = {
+    "ÇANKAYA": {
+        "green_area_path": "data/ca_green_area.xlsx",
+        "output_prefix": "data/ca",
+        "location": {"lat": 39.9208, "lon": 32.8541, "elevation": 900},
+    },
+    "ETİMESGUT": {
+        "green_area_path": "data/et_green_area.xlsx",
+        "output_prefix": "data/et",
+        "location": {"lat": 39.9474, "lon": 32.6711, "elevation": 870},
+    },
+    "KEÇİÖREN": {
+        "green_area_path": "data/ke_green_area.xlsx",
+        "output_prefix": "data/ke",
+        "location": {"lat": 39.9787, "lon": 32.8639, "elevation": 900},
+    },
+    "YENİMAHALLE": {
+        "green_area_path": "data/ye_green_area.xlsx",
+        "output_prefix": "data/ye",
+        "location": {"lat": 39.9687, "lon": 32.8110, "elevation": 880},
+    },
+}
 
-# Get matching names from two dataframes
-df_ca_name_similarity = similarity.best_matches(
-    list(df_ca_green_area["PARK ADI"].unique()), list(df_ca_invoice["name"].unique())
-)
+# Invoices of all districts, partitioned into one district=<name> folder each.
+PARTITIONED_OUTPUT_PATH = "data/invoice_assessment"
 
-df_ca_name_similarity.to_csv("data/ca_name_matching.csv", index=False)
+DEFAULT_SETTINGS = {
+    # Period the water need is estimated for.
+    "start_date": "2015-01-01",
+    "end_date": "2024-01-10",
+    # Crop coefficient applied to the reference evapotranspiration: one value or
+    # 12 monthly values (January first).
+    "kc": 0.8,
+    # Months of the watering season; the water need is zero in other months.
+    "season_months": irrigation.DEFAULT_SEASON_MONTHS,
+    # Invoice names need a similarity above this to be matched to a park.
+    "score_threshold": 0.95,
+    # "turkish" compares character n-grams of case-folded, abbreviation-expanded
+    # names; "word" is the plain TF-IDF (see util/similarity.py).
+    "match_mode": "turkish",
+    "cache_dir": weather.CACHE_DIR,
+    # Only assess invoices not seen in a previous run, or whose park match, grass
+    # area or water need changed, and merge them into the output. Set to False
+    # (--full) to always reassess everything.
+    "incremental": True,
+    # Outputs are written as Parquet; set to False to skip the CSV copies.
+    "export_csv": True,
+}
 
-# 1) Filter the similarity DataFrame for high-confidence matches
-score_threshold = 0.95
-df_ca_name_similarity_filtered = df_ca_name_similarity[
-    df_ca_name_similarity.score > score_threshold
-].copy()
+# Stages in run order. Each stage reads the artifacts named in STAGE_INPUTS and
+# produces the artifacts it returns; artifacts are kept in <output_prefix>_stages/
+# so a single stage can be rerun from the previous stages' results.
+STAGES = ["load", "match", "weather", "estimate", "join", "write"]
+STAGE_INPUTS = {
+    "load": [],
+    "match": ["invoices", "registry"],
+    "weather": ["matched"],
+    "estimate": ["grid_weather", "matched"],
+    "join": ["invoices", "matched", "water_need"],
+    "write": ["name_similarity", "assessed", "invoice_state"],
+}
+# First stage using each setting; reruns starting after it keep its stored results.
+SETTING_STAGES = {
+    "score_threshold": "match",
+    "match_mode": "match",
+    "start_date": "weather",
+    "end_date": "weather",
+    "kc": "estimate",
+    "season_months": "estimate",
+}
 
-# 2) Merge df_ca_green_area with the filtered similarity DataFrame (inner join)
-df_ca_matched = df_ca_green_area[["PARK ADI", "ÇİM ALAN"]].merge(
-    df_ca_name_similarity_filtered[["name_1", "name_2"]],
-    how="inner",
-    left_on="PARK ADI",
-    right_on="name_1",
-)
 
-# 3) Rename columns and keep only the columns needed
-df_ca_matched.rename(
-    columns={"name_2": "name_invoice", "ÇİM ALAN": "grass_area"}, inplace=True
-)
+def read_green_area(green_area_path, cache_dir=green_area.CACHE_DIR):
+    """Reads a district's green-area registry, keeping the numbered park rows."""
+    # Parsed once per workbook version; later runs read the Parquet snapshot.
+    return green_area.load_green_area(green_area_path, cache_dir=cache_dir)
 
-# Create a range of dates for water estimates
-date_range = pd.date_range(start="2015-01-01", end="2024-01-10")
-dates_without_time = date_range.date
-df_date = pd.DataFrame({"date": dates_without_time})
 
-from functools import partial
+def read_park_locations(park_locations_path):
+    """Reads the optional PARK ADI, lat, lon and elevation table (None if missing)."""
+    if not os.path.exists(park_locations_path):
+        return None
+    return pd.read_csv(
+        park_locations_path, usecols=["PARK ADI", "lat", "lon", "elevation"]
+    ).drop_duplicates(subset="PARK ADI")
 
-# Create a partial function for water estimation
-partial_estimate = partial(
-    weather.estimate_water_needs, lat=39.9208, lon=32.8541, kc=0.8, elevation=900
-)
 
-df_water_need = partial_estimate(
-    start_date=df_date.date.iloc[0], end_date=df_date.date.iloc[-1], park_area=1
-)[["date", "water_need_m3"]]
+def calculate_total_water(invoices, water_dates, water_need):
+    """For every invoice, sum its location's water need between start and end read dates."""
+    days, prefix = interval.build_prefix_sum(water_dates, water_need)
+    total_water = interval.interval_sums(
+        days,
+        prefix,
+        invoices["start_read_date"],
+        invoices["end_read_date"],
+        rows=invoices["location"],
+    )
+    # Daily values carry 4 decimals; rounding drops cumulative-sum float noise.
+    return total_water.round(4)
 
-# Ensure the 'date' column is a datetime object
-df_water_need["date"] = pd.to_datetime(df_water_need["date"])
 
-# Update lambda condition to reflect the desired watering season.
-# Use 4 instead of 6 if you intend the season to start in April.
-df_water_need["water_need_m3"] = df_water_need.apply(
-    lambda row: row["water_need_m3"] if 6 <= row["date"].month <= 10 else 0,
-    axis=1
-)
+def load_stage(district, config, settings):
+    """Reads the district's invoices and its green-area registry."""
+    # Import the district's invoices, reading the export in chunks and dropping other
+    # districts early. "<district> BELEDİYESİ" is removed from the "name" column.
+    df_invoice = ingest.read_district_invoices(
+        config.get("invoice_path", INVOICE_PATH),
+        district,
+        name_prefix=config.get("name_prefix", f"{district} BELEDİYESİ"),
+    )
 
-def calculate_total_water(row, water_data):
-    """For a given invoice row, sum water_need_m3 for dates between start and end."""
-    start_date = pd.to_datetime(row["start_read_date"])
-    end_date = pd.to_datetime(row["end_read_date"])
-    mask = (water_data["date"] >= start_date) & (water_data["date"] <= end_date)
-    total_water = water_data.loc[mask, "water_need_m3"].sum()
-    return total_water
+    # Convert date columns to datetime.date
+    df_invoice["start_read_date"] = df_invoice["start_read_date"].dt.date
+    df_invoice["end_read_date"] = df_invoice["end_read_date"].dt.date
+    df_invoice["subscription"] = df_invoice["subscription"].str.strip()
 
+    # Fingerprint every input invoice (subscription, read dates, volume)
+    df_invoice["fingerprint"] = incremental.fingerprint_invoices(df_invoice)
 
-partial_calculate_total_water = partial(calculate_total_water, water_data=df_water_need)
+    df_green_area = read_green_area(config["green_area_path"])
+    df_registry = pd.DataFrame(
+        {
+            "PARK ADI": df_green_area["PARK ADI"],
+            "grass_area": pd.to_numeric(df_green_area["ÇİM ALAN"], errors="coerce"),
+        }
+    )
+    return {"invoices": df_invoice, "registry": df_registry}
 
-df_ca_invoice["water_need_m3"] = df_ca_invoice.apply(
-    partial_calculate_total_water, axis=1
-)
 
-# 4) Merge df_ca_invoice with our matched DataFrame (left join on 'name' vs 'name_invoice')
-df_ca_invoice = df_ca_invoice.merge(
-    df_ca_matched[["name_invoice", "grass_area"]],
-    left_on="name",
-    right_on="name_invoice",
-    how="left",
-)
+def match_stage(district, config, settings, invoices, registry):
+    """Matches invoice names to registry parks and attaches the parks' locations."""
+    output_prefix = config["output_prefix"]
 
-# 5) Drop rows without grass_area (no match found)
-df_ca_invoice.dropna(subset=["grass_area"], inplace=True)
+    # Match every invoice name to its most similar registry park. Matches are kept in
+    # a persistent index, so only invoice names not seen before are scored; manual
+    # matches in the overrides file win.
+    df_name_similarity = name_index.match_invoice_names(
+        registry["PARK ADI"].unique(),
+        invoices["name"].unique(),
+        mode=settings["match_mode"],
+        index_dir=os.path.join(name_index.INDEX_DIR, os.path.basename(output_prefix)),
+        overrides_path=f"{output_prefix}_name_overrides.csv",
+    )
 
-# Calculate total water need for the grass area
-df_ca_invoice["water_need_total"] = (
-    df_ca_invoice["water_need_m3"] * df_ca_invoice["grass_area"]
-)
+    # 1) Filter the similarity DataFrame for high-confidence matches
+    df_name_similarity_filtered = df_name_similarity[
+        df_name_similarity.score > settings["score_threshold"]
+    ].copy()
+
+    # 2) Merge the registry with the filtered similarity DataFrame (inner join).
+    # Park names used by several registry entries (e.g. "Sevgi Parkı" in different
+    # neighbourhoods) cannot be attributed to one park by name, so they are left out.
+    # Names are compared as the matcher sees them: "Duygu Parkı" and "Duygu Parkı
+    # (2018)" are the same name in "turkish" mode.
+    match_key = similarity.match_keys(registry["PARK ADI"], settings["match_mode"])
+    df_unique_parks = registry[~match_key.duplicated(keep=False)]
+    df_matched = df_unique_parks.merge(
+        df_name_similarity_filtered[["name_1", "name_2"]],
+        how="inner",
+        left_on="PARK ADI",
+        right_on="name_1",
+    )
+
+    # 3) Rename columns and keep only the columns needed
+    df_matched = df_matched.rename(columns={"name_2": "name_invoice"})[
+        ["PARK ADI", "name_invoice", "grass_area"]
+    ]
+
+    # Attach per-park coordinates and elevation. Parks missing from the optional
+    # location table fall back to the district's coordinate.
+    location = config["location"]
+    df_park_locations = read_park_locations(f"{output_prefix}_park_locations.csv")
+    if df_park_locations is not None:
+        df_matched = df_matched.merge(
+            df_park_locations, on="PARK ADI", how="left"
+        ).fillna(location)
+    else:
+        df_matched = df_matched.assign(**location)
+
+    return {"name_similarity": df_name_similarity, "matched": df_matched}
+
+
+def weather_stage(district, config, settings, matched):
+    """Fetches the daily weather once per weather grid cell of the matched parks."""
+    grid_weather = weather.fetch_grid_weather(
+        matched["lat"],
+        matched["lon"],
+        matched["elevation"],
+        start_date=settings["start_date"],
+        end_date=settings["end_date"],
+        cache_dir=settings["cache_dir"],
+    )
+    return {"grid_weather": grid_weather}
+
+
+def estimate_stage(district, config, settings, grid_weather, matched):
+    """Estimates the daily water need per m² under every matched park's irrigation calendar."""
+    # Each park gets a monthly kc curve that is zero outside its watering season:
+    # the district's (or the settings') default unless the optional calendar table
+    # gives the park its own season or kc.
+    calendars = irrigation.park_calendars(
+        matched["PARK ADI"],
+        kc=config.get("kc", settings["kc"]),
+        season_months=config.get("season_months", settings["season_months"]),
+        park_calendars_df=irrigation.read_park_calendars(
+            f"{config['output_prefix']}_irrigation_calendar.csv"
+        ),
+    )
+
+    # water_need is a 2-D (row × day) array with one row per distinct weather
+    # location and calendar; location_index maps the matched parks to its rows.
+    location_index, water_need = irrigation.apply_calendars(
+        weather.grid_et0(grid_weather),
+        grid_weather["location_index"],
+        calendars,
+        grid_weather["dates"],
+    )
+
+    return {
+        "water_need": {
+            "location_index": location_index,
+            "dates": grid_weather["dates"],
+            "water_need": water_need,
+        }
+    }
+
+
+def join_stage(district, config, settings, invoices, matched, water_need):
+    """Sums each invoice's water need over its read period and scales it by the grass area."""
+    invoice_table = f"{config['output_prefix']}_invoice"
+    state_path = f"{config['output_prefix']}_invoice_state.parquet"
 
-df_ca_invoice = df_ca_invoice[
-    [
-        "subscription",
-        "name",
-        "start_read_date",
-        "end_read_date",
-        "water_need_total",
-        "volume",
-        "grass_area",
+    # The assessment of an invoice depends only on its own row, its park's grass
+    # area and the daily water need at the park's location. Each matched name gets
+    # a hash of these (unmatched names an empty one), so a changed setting (kc,
+    # season, dates), registry entry or match (e.g. a manual override) reassesses
+    # exactly the invoices of the names it affects.
+    days = pd.DatetimeIndex(water_need["dates"]).to_numpy("datetime64[D]")
+    series_hashes = [
+        incremental.hash_inputs(days, series) for series in water_need["water_need"]
     ]
-].copy()
+    name_hashes = pd.Series(
+        [
+            incremental.hash_inputs(float(grass_area), series_hashes[location])
+            for grass_area, location in zip(
+                matched["grass_area"], water_need["location_index"]
+            )
+        ],
+        index=matched["name_invoice"].to_numpy(),
+    )
+    name_hashes = name_hashes[~name_hashes.index.duplicated()]
+    inputs_hashes = invoices["name"].map(name_hashes).fillna("").to_numpy(dtype=object)
+
+    # Only invoices that were not assessed in a previous run with the same inputs
+    # (new or changed fingerprint, or changed inputs hash) are processed.
+    previous_output_exists = os.path.exists(storage.table_path(invoice_table))
+    incremental_run = settings["incremental"] and previous_output_exists
+    reassessed = np.ones(len(invoices), dtype=bool)
+    if incremental_run:
+        reassessed = incremental.stale_invoices(
+            invoices["fingerprint"], inputs_hashes, incremental.load_state(state_path)
+        )
+    df_invoice = invoices[reassessed].copy()
+
+    matched = matched.assign(location=water_need["location_index"])
+
+    # 4) Merge df_invoice with our matched DataFrame (left join on 'name' vs 'name_invoice')
+    df_invoice = df_invoice.merge(
+        matched[["name_invoice", "grass_area", "location"]],
+        left_on="name",
+        right_on="name_invoice",
+        how="left",
+    )
+
+    # 5) Drop rows without grass_area (no match found). Registry areas are whole m².
+    df_invoice.dropna(subset=["grass_area"], inplace=True)
+    df_invoice["grass_area"] = df_invoice["grass_area"].astype(int)
+    df_invoice["location"] = df_invoice["location"].astype(int)
+
+    df_invoice["water_need_m3"] = calculate_total_water(
+        df_invoice,
+        pd.DatetimeIndex(water_need["dates"]),
+        water_need["water_need"],
+    )
+
+    # Calculate total water need for the grass area
+    df_invoice["water_need_total"] = (
+        df_invoice["water_need_m3"] * df_invoice["grass_area"]
+    )
+
+    df_invoice = df_invoice[
+        [
+            "subscription",
+            "name",
+            "start_read_date",
+            "end_read_date",
+            "water_need_total",
+            "volume",
+            "grass_area",
+        ]
+    ].copy()
+
+    # Rename "water_need_total" -> "estimated_volume"
+    df_invoice.rename(columns={"water_need_total": "estimated_volume"}, inplace=True)
+    df_invoice["estimated_volume"] = df_invoice["estimated_volume"].astype(int)
+
+    # Rebuild the output from the previous rows of invoices still in the input and
+    # the newly assessed ones
+    if incremental_run:
+        df_existing = storage.read_table(invoice_table).astype({"subscription": str})
+        for column in ["start_read_date", "end_read_date"]:
+            df_existing[column] = pd.to_datetime(df_existing[column]).dt.date
+        df_invoice = incremental.merge_assessed(
+            df_existing,
+            df_invoice,
+            invoices["fingerprint"],
+            invoices["fingerprint"][~reassessed],
+        )
+
+    return {
+        "assessed": df_invoice,
+        "invoice_state": incremental.build_state(
+            invoices["fingerprint"], inputs_hashes
+        ),
+    }
+
+
+def write_stage(district, config, settings, name_similarity, assessed, invoice_state):
+    """Writes the district's invoice, name matching and monthly tables."""
+    output_prefix = config["output_prefix"]
+    export_csv = settings["export_csv"]
+
+    storage.write_table(
+        name_similarity, f"{output_prefix}_name_matching", export_csv=export_csv
+    )
+    storage.write_table(
+        assessed,
+        f"{output_prefix}_invoice",
+        dates=["start_read_date", "end_read_date"],
+        categories=["name"],
+        export_csv=export_csv,
+    )
+
+    # Precompute the park × month aggregates the dashboard slices for its KPIs and chart.
+    # Invoices starting before the estimated period are left out, as the dashboard
+    # leaves them out of its park list and invoice table.
+    in_period = pd.to_datetime(assessed["start_read_date"]) >= pd.Timestamp(
+        settings["start_date"]
+    )
+    storage.write_table(
+        cube.build_monthly_cube(assessed[in_period]),
+        f"{output_prefix}_monthly_cube",
+        dates=["month"],
+        categories=["name"],
+        export_csv=export_csv,
+    )
+
+    # Record every input invoice as assessed, with its inputs hash, for the next
+    # incremental run
+    incremental.save_state(f"{output_prefix}_invoice_state.parquet", invoice_state)
+    return {}
+
+
+STAGE_FUNCTIONS = {
+    "load": load_stage,
+    "match": match_stage,
+    "weather": weather_stage,
+    "estimate": estimate_stage,
+    "join": join_stage,
+    "write": write_stage,
+}
+
+
+def _save_artifact(stage_dir, name, value):
+    """Stores a DataFrame as Parquet and a dict of arrays as .npz."""
+    os.makedirs(stage_dir, exist_ok=True)
+    if isinstance(value, pd.DataFrame):
+        value.to_parquet(os.path.join(stage_dir, f"{name}.parquet"), index=False)
+    else:
+        np.savez(os.path.join(stage_dir, f"{name}.npz"), **value)
+
+
+def _load_artifact(stage_dir, name):
+    """Loads an artifact stored by _save_artifact."""
+    parquet_path = os.path.join(stage_dir, f"{name}.parquet")
+    npz_path = os.path.join(stage_dir, f"{name}.npz")
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as arrays:
+            return dict(arrays)
+    raise FileNotFoundError(
+        f"Artifact {name!r} not found in {stage_dir}; run the stage producing it first."
+    )
+
+
+def run_pipeline(district, config, settings=None, stages=STAGES):
+    """
+    Runs the assessment stages for one district.
+
+    Artifacts produced by a stage are passed on in memory and also stored in
+    <output_prefix>_stages/. A stage whose inputs were not produced in this run
+    reads them from there, so any single stage (or the tail of the pipeline) can
+    be rerun after changing its settings.
+
+    Parameters:
+      - district: District name in the invoice export (e.g. "ÇANKAYA")
+      - config: District entry of DISTRICTS (green_area_path, output_prefix,
+        location and optionally name_prefix and invoice_path)
+      - settings: Overrides of DEFAULT_SETTINGS
+      - stages: Stages to run, in order (default=STAGES)
+
+    Returns:
+      - Dict of the artifacts produced or read by the stages that ran
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    stage_dir = f"{config['output_prefix']}_stages"
+
+    artifacts = {}
+    for stage in stages:
+        inputs = {
+            name: artifacts[name] if name in artifacts else _load_artifact(stage_dir, name)
+            for name in STAGE_INPUTS[stage]
+        }
+        artifacts.update(inputs)
+        with perf.timed(f"pipeline.{stage}", district=district):
+            outputs = STAGE_FUNCTIONS[stage](district, config, settings, **inputs)
+        for name, value in outputs.items():
+            _save_artifact(stage_dir, name, value)
+        artifacts.update(outputs)
+    return artifacts
+
+
+def _run_district(district, config, settings, stages):
+    """Worker entry point; returns only the assessed invoices, if any."""
+    return run_pipeline(district, config, settings, stages).get("assessed")
+
+
+def prefetch_district_weather(districts, settings=None):
+    """
+    Fills the shared weather cache for every park location of the given districts.
+
+    Workers then read the cached series instead of each querying the API.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    locations = []
+    for config in districts.values():
+        locations.append(pd.DataFrame([config["location"]]))
+        df_park_locations = read_park_locations(
+            f"{config['output_prefix']}_park_locations.csv"
+        )
+        if df_park_locations is not None:
+            locations.append(df_park_locations.dropna(subset=["lat", "lon"]))
+    locations = pd.concat(locations, ignore_index=True)
+    return weather.prefetch_grid_weather(
+        locations["lat"],
+        locations["lon"],
+        settings["start_date"],
+        settings["end_date"],
+        cache_dir=settings["cache_dir"],
+    )
+
+
+def assess_districts(districts=DISTRICTS, settings=None, stages=STAGES, max_workers=None):
+    """
+    Assesses several districts in parallel, one worker process per district.
+
+    Districts without a green-area registry are skipped. The weather series are
+    fetched once up front and shared through the weather cache. When the write
+    stage runs, the invoices of all districts are also written to one dataset
+    partitioned by district. A district whose run fails does not stop the others:
+    their results are still returned and written, and a RuntimeError naming the
+    failed districts is raised afterwards.
+
+    Parameters:
+      - districts: Mapping of district name to its config (default=DISTRICTS)
+      - settings: Overrides of DEFAULT_SETTINGS
+      - stages: Stages to run, in order (default=STAGES)
+      - max_workers: Number of worker processes (default=one per CPU)
+
+    Returns:
+      - DataFrame of all assessed invoices with a district column, or None if
+        the join and write stages did not run
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    skipped = [
+        district
+        for district, config in districts.items()
+        if not os.path.exists(config["green_area_path"])
+    ]
+    if skipped:
+        print(f"Skipping districts without a green-area registry: {skipped}")
+    districts = {
+        district: config
+        for district, config in districts.items()
+        if district not in skipped
+    }
+
+    if "weather" in stages and settings["cache_dir"] is not None:
+        with perf.timed("pipeline.prefetch_weather"):
+            prefetch_district_weather(districts, settings)
+
+    # Workers are spawned rather than forked: the parent has already started
+    # Arrow's thread pools, which do not survive a fork.
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = {
+            district: executor.submit(_run_district, district, config, settings, stages)
+            for district, config in districts.items()
+        }
+        # A failing district is reported without discarding the others' results.
+        assessed = {}
+        failed = {}
+        for district, future in futures.items():
+            try:
+                assessed[district] = future.result()
+            except Exception as error:
+                failed[district] = error
+                print(f"Assessing {district} failed: {error!r}")
+    results = [
+        df.assign(district=district)
+        for district, df in assessed.items()
+        if df is not None
+    ]
+
+    df_all = None
+    if results:
+        df_all = pd.concat(results, ignore_index=True)
+        if "write" in stages:
+            storage.write_partitioned_table(
+                df_all,
+                PARTITIONED_OUTPUT_PATH,
+                partition_col="district",
+                dates=["start_read_date", "end_read_date"],
+            )
+    if failed:
+        raise RuntimeError(
+            f"Assessment failed for districts {list(failed)}"
+        ) from next(iter(failed.values()))
+    return df_all
+
+
+def run_scenarios(district, config, scenario_table, settings=None):
+    """
+    Estimates every invoice of a district under every scenario of a parameter grid.
+
+    Reads the load stage's artifacts, matches invoice names at the lowest threshold
+    of the grid and computes the daily ET0 once (from the weather cache); the
+    scenarios are then evaluated together by scenarios.scenario_volumes. Stage
+    artifacts and outputs are left untouched. Scenario kc and seasons apply to all
+    parks alike.
+
+    Parameters:
+      - district: District name in the invoice export
+      - config: District entry of DISTRICTS
+      - scenario_table: DataFrame returned by scenarios.scenario_grid
+      - settings: Overrides of DEFAULT_SETTINGS (dates, match mode, cache)
+
+    Returns:
+      - Tuple (invoices, volumes): the invoices that can be assessed under some
+        scenario and the float32 (scenario × invoice) estimated volume array
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    stage_dir = f"{config['output_prefix']}_stages"
+    invoices = _load_artifact(stage_dir, "invoices")
+    registry = _load_artifact(stage_dir, "registry")
+
+    lowest_threshold = scenario_table["score_threshold"].min()
+    matched = match_stage(
+        district,
+        config,
+        {**settings, "score_threshold": lowest_threshold},
+        invoices,
+        registry,
+    )
+    df_matched, df_name_similarity = matched["matched"], matched["name_similarity"]
+    grid_weather = weather_stage(district, config, settings, df_matched)["grid_weather"]
+
+    df_matched = df_matched.assign(
+        location=grid_weather["location_index"],
+        score=df_matched["name_invoice"].map(
+            df_name_similarity.set_index("name_2")["score"]
+        ),
+    )
+    df_invoice = invoices.merge(
+        df_matched[["name_invoice", "grass_area", "location", "score"]],
+        left_on="name",
+        right_on="name_invoice",
+        how="inner",
+    ).dropna(subset=["grass_area"])
+    df_invoice["grass_area"] = df_invoice["grass_area"].astype(int)
+    df_invoice = df_invoice[
+        [
+            "subscription",
+            "name",
+            "start_read_date",
+            "end_read_date",
+            "volume",
+            "grass_area",
+            "location",
+            "score",
+        ]
+    ].reset_index(drop=True)
+
+    volumes = scenarios.scenario_volumes(
+        weather.grid_et0(grid_weather),
+        grid_weather["dates"],
+        df_invoice,
+        scenario_table,
+    )
+    return df_invoice, volumes
+
+
+def write_scenarios(district, config, scenario_table, settings=None):
+    """
+    Runs run_scenarios and writes its results under the district's output prefix.
+
+    <prefix>_scenarios holds the scenario grid with its totals and
+    <prefix>_scenario_volumes.npz the volume array with the invoice keys.
+    """
+    output_prefix = config["output_prefix"]
+    df_invoice, volumes = run_scenarios(district, config, scenario_table, settings)
+
+    summary = scenarios.summarize(scenario_table, volumes, df_invoice["volume"])
+    summary = summary.assign(
+        kc=summary["kc"].astype(str),
+        season_months=summary["season_months"].map(
+            lambda months: ",".join(map(str, months))
+        ),
+    )
+    storage.write_table(summary, f"{output_prefix}_scenarios", export_csv=True)
+    np.savez_compressed(
+        f"{output_prefix}_scenario_volumes.npz",
+        estimated_volume=volumes,
+        subscription=df_invoice["subscription"].to_numpy(str),
+        name=df_invoice["name"].to_numpy(str),
+        start_read_date=pd.to_datetime(df_invoice["start_read_date"]).to_numpy(
+            "datetime64[D]"
+        ),
+        end_read_date=pd.to_datetime(df_invoice["end_read_date"]).to_numpy(
+            "datetime64[D]"
+        ),
+    )
+    return summary
+
+
+def parse_months(text):
+    """Parses a month list such as "6-10" or "4,5,6" into a tuple of month numbers."""
+    try:
+        return irrigation.parse_months(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def parse_kc(text):
+    """Parses one kc value or 12 comma-separated monthly values."""
+    try:
+        return irrigation.parse_kc(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the water need of park invoices and compare it with the billed volume."
+    )
+    parser.add_argument(
+        "--district",
+        action="append",
+        choices=list(DISTRICTS),
+        help="District to assess; repeat for several (default: all with a registry)",
+    )
+    parser.add_argument(
+        "--kc",
+        type=parse_kc,
+        default=DEFAULT_SETTINGS["kc"],
+        help="Crop coefficient, or 12 comma-separated monthly values (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--season-months",
+        type=parse_months,
+        default=DEFAULT_SETTINGS["season_months"],
+        help='Months of the watering season, e.g. "6-10", "4,5,6" or "11-2" (default: 6-10)',
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_SETTINGS["score_threshold"],
+        help="Minimum name similarity for a match (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--start-date",
+        default=DEFAULT_SETTINGS["start_date"],
+        help="First day of the estimated period (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--end-date",
+        default=DEFAULT_SETTINGS["end_date"],
+        help="Last day of the estimated period (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--match-mode",
+        choices=["word", "turkish"],
+        default=DEFAULT_SETTINGS["match_mode"],
+    )
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument(
+        "--only-stage", choices=STAGES, help="Run a single stage from stored artifacts"
+    )
+    stage_group.add_argument(
+        "--from-stage", choices=STAGES, help="Run this stage and the ones after it"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_SETTINGS["cache_dir"],
+        help="Weather cache directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Reassess all invoices instead of only new or changed ones",
+    )
+    parser.add_argument("--no-csv", action="store_true", help="Skip the CSV exports")
+    parser.add_argument(
+        "--workers", type=int, help="Number of worker processes (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--perf-log", help="Append per-stage timings as JSON lines to this file"
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also record the peak memory of every stage (slower)",
+    )
+    sweep_group = parser.add_argument_group(
+        "scenario sweep",
+        "Estimate all invoices under every combination of the given values instead "
+        "of running the stages (needs the load stage's results). Unset parameters "
+        "use the value of the options above. Writes <prefix>_scenarios and "
+        "<prefix>_scenario_volumes.npz.",
+    )
+    sweep_group.add_argument("--sweep-kc", type=parse_kc, nargs="+", metavar="KC")
+    sweep_group.add_argument(
+        "--sweep-season", type=parse_months, nargs="+", metavar="MONTHS"
+    )
+    sweep_group.add_argument(
+        "--sweep-efficiency", type=float, nargs="+", metavar="EFFICIENCY"
+    )
+    sweep_group.add_argument(
+        "--sweep-threshold", type=float, nargs="+", metavar="THRESHOLD"
+    )
+    args = parser.parse_args(argv)
+
+    # Set through the environment so the worker processes log as well.
+    if args.perf_log:
+        os.environ[perf.LOG_ENV] = args.perf_log
+    if args.trace_memory:
+        os.environ[perf.TRACE_MEMORY_ENV] = "1"
+
+    settings = {
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "kc": args.kc,
+        "season_months": args.season_months,
+        "score_threshold": args.threshold,
+        "match_mode": args.match_mode,
+        "cache_dir": args.cache_dir,
+        "incremental": not args.full,
+        "export_csv": not args.no_csv,
+    }
+    if args.only_stage:
+        stages = [args.only_stage]
+    elif args.from_stage:
+        stages = STAGES[STAGES.index(args.from_stage) :]
+    else:
+        stages = STAGES
+    sweep = args.sweep_kc or args.sweep_season or args.sweep_efficiency or args.sweep_threshold
+    # A setting changed for stages that do not run would silently have no effect.
+    ignored = [
+        name
+        for name, stage in SETTING_STAGES.items()
+        if settings[name] != DEFAULT_SETTINGS[name] and stage not in stages
+    ]
+    if ignored and not sweep:
+        first_stage = min((SETTING_STAGES[name] for name in ignored), key=STAGES.index)
+        options = {"score_threshold": "--threshold"}
+        parser.error(
+            ", ".join(options.get(name, "--" + name.replace("_", "-")) for name in ignored)
+            + f" would have no effect without the stage using it; rerun from the "
+            f"{first_stage} stage (--from-stage {first_stage})."
+        )
+    districts = {
+        district: config
+        for district, config in DISTRICTS.items()
+        if not args.district or district in args.district
+    }
+
+    if sweep:
+        scenario_table = scenarios.scenario_grid(
+            kc=args.sweep_kc or [args.kc],
+            season_months=args.sweep_season or [args.season_months],
+            efficiency=args.sweep_efficiency or [1.0],
+            score_threshold=args.sweep_threshold or [args.threshold],
+        )
+        for district, config in districts.items():
+            if not os.path.exists(config["green_area_path"]):
+                continue
+            with perf.timed("pipeline.scenarios", district=district):
+                summary = write_scenarios(district, config, scenario_table, settings)
+            print(f"{district}: {len(summary)} scenarios")
+            print(summary.to_string(index=False))
+        return
+
+    with perf.timed("pipeline.total", stages=",".join(stages)):
+        assess_districts(districts, settings, stages, max_workers=args.workers)
 
-# Rename "water_need_total" -> "estimated_volume"
-df_ca_invoice.rename(columns={"water_need_total": "estimated_volume"}, inplace=True)
-df_ca_invoice["estimated_volume"] = df_ca_invoice["estimated_volume"].astype(int)
 
-df_ca_invoice.to_csv("data/ca_invoice.csv", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+
+import streamlit as st
+
+from util import cube, interval, storage
+
+# Table paths without extension; Parquet is read when present, else the CSV export.
+INVOICE_PATH = "data/ca_invoice"
+MONTHLY_CUBE_PATH = "data/ca_monthly_cube"
+
+INVOICE_COLUMNS = [
+    "name",
+    "grass_area",
+    "start_read_date",
+    "end_read_date",
+    "volume",
+    "estimated_volume",
+]
+
+
+@st.cache_data(show_spinner=False)
+def _read_invoices(path, mtime):
+    """Reads the processed invoice table. mtime is only part of the cache key."""
+    invoice_df = storage.read_table(
+        path,
+        columns=INVOICE_COLUMNS,
+        dates=["start_read_date", "end_read_date"],
+        categories=["name"],
+    )[INVOICE_COLUMNS]
+    invoice_df["volume"] = invoice_df["volume"].astype(int)
+    invoice_df["estimated_volume"] = invoice_df["estimated_volume"].astype(int)
+    invoice_df["grass_area"] = invoice_df["grass_area"].astype(int)
+
+    # Derived columns used by every page.
+    invoice_df["difference"] = invoice_df["volume"] - invoice_df["estimated_volume"]
+    invoice_df["difference_pct"] = (
+        ((invoice_df["difference"] / invoice_df["estimated_volume"]) * 100)
+        .replace([float("inf"), float("-inf")], 0)
+        .fillna(0)
+    )
+    invoice_df["days"] = (
+        invoice_df["end_read_date"] - invoice_df["start_read_date"]
+    ).dt.days + 1
+    return invoice_df
+
+
+def load_invoices(path=INVOICE_PATH):
+    """
+    Loads the processed invoices with native dtypes and precomputed columns.
+
+    The parsed frame is cached across Streamlit reruns and sessions, and is
+    re-read only when the backing file's modification time changes.
+
+    Returns:
+      - DataFrame with a categorical name, datetime64 read dates, integer volumes
+        and the derived columns difference, difference_pct and days
+    """
+    return _read_invoices(path, os.path.getmtime(storage.table_path(path)))
+
+
+@st.cache_data(show_spinner=False)
+def _build_invoice_index(path, mtime):
+    """Indexes the invoice periods per park. mtime is only part of the cache key."""
+    invoice_df = _read_invoices(path, mtime)
+    return interval.build_interval_index(
+        invoice_df["start_read_date"],
+        invoice_df["end_read_date"],
+        groups=invoice_df["name"],
+    )
+
+
+def load_invoice_index(path=INVOICE_PATH):
+    """
+    Loads the interval index of the invoices returned by load_invoices.
+
+    Date filters query it with util.interval.query_intervals, which returns row
+    positions in that frame, instead of scanning both date columns.
+
+    Returns:
+      - Dict returned by util.interval.build_interval_index, grouped by park name
+    """
+    return _build_invoice_index(path, os.path.getmtime(storage.table_path(path)))
+
+
+@st.cache_data(show_spinner=False)
+def _read_monthly_cube(path, mtime):
+    """Reads the park × month table into arrays. mtime is only part of the cache key."""
+    cube_df = storage.read_table(path, dates=["month"], categories=["name"])
+    return cube.cube_array(cube_df)
+
+
+@st.cache_data(show_spinner=False)
+def _build_monthly_cube(invoice_path, mtime):
+    """Builds the park × month arrays from the invoices. mtime is only part of the cache key."""
+    return cube.cube_array(cube.build_monthly_cube(_read_invoices(invoice_path, mtime)))
+
+
+def load_monthly_cube(path=MONTHLY_CUBE_PATH, invoice_path=INVOICE_PATH):
+    """
+    Loads the precomputed park × month aggregates written by the processing script.
+
+    Without that table (e.g. when only the invoice table is at hand), the
+    aggregates are built from all its invoices once and cached.
+
+    Returns:
+      - Tuple (parks, months, values, grass_area) as returned by util.cube.cube_array
+    """
+    cube_path = storage.table_path(path)
+    if os.path.exists(cube_path):
+        return _read_monthly_cube(path, os.path.getmtime(cube_path))
+    return _build_monthly_cube(
+        invoice_path, os.path.getmtime(storage.table_path(invoice_path))
+    )
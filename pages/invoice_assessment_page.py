@@ -3,23 +3,11 @@ import pandas as pd
 import altair as alt
 from datetime import datetime
 
+from loader import load_invoice_index, load_invoices
+from util import downsample, interval, ranking
+
 # Load and Prepare Data
-invoice_df = pd.read_csv("data/ca_invoice.csv")[
-    [
-        "name",
-        "grass_area",
-        "start_read_date",
-        "end_read_date",
-        "volume",
-        "estimated_volume",
-    ]
-]
-invoice_df["volume"] = invoice_df["volume"].astype(int)
-
-# Calculate the difference between actual and estimated volume; convert date columns.
-invoice_df["difference"] = invoice_df["volume"] - invoice_df["estimated_volume"]
-invoice_df["start_read_date"] = pd.to_datetime(invoice_df["start_read_date"]).dt.date
-invoice_df["end_read_date"] = pd.to_datetime(invoice_df["end_read_date"]).dt.date
+invoice_df = load_invoices()
 
 # Streamlit Application Layout
 st.title("Actual Water Consumption vs. Weather-Based Water Need Estimation")
@@ -30,6 +18,10 @@ st.write(
     """
 )
 
+if invoice_df.empty:
+    st.info("No invoices to show.")
+    st.stop()
+
 # Sidebar Filters
 st.sidebar.header("Filter Options")
 
@@ -38,24 +30,49 @@ parks = invoice_df["name"].unique().tolist()
 selected_parks = st.sidebar.multiselect("Select Park(s):", options=parks, default=parks)
 
 # Filter by date range.
-min_date = invoice_df["start_read_date"].min()
-max_date = invoice_df["end_read_date"].max()
+min_date = invoice_df["start_read_date"].min().date()
+max_date = invoice_df["end_read_date"].max().date()
 selected_date_range = st.sidebar.date_input("Select Date Range:", [min_date, max_date])
+prorate = st.sidebar.checkbox(
+    "Prorate invoices partly inside the date range",
+    help="Scale the volumes of invoices overlapping the range edges by their share of days inside it.",
+)
 
 # Apply filters.
-filtered_df = invoice_df[invoice_df["name"].isin(selected_parks)]
 if len(selected_date_range) == 2:
-    start_filter = pd.to_datetime(selected_date_range[0]).date()
-    end_filter = pd.to_datetime(selected_date_range[1]).date()
-    filtered_df = filtered_df[
-        (filtered_df["end_read_date"] >= start_filter)
-        & (filtered_df["start_read_date"] <= end_filter)
-    ]
+    start_filter = pd.Timestamp(selected_date_range[0])
+    end_filter = pd.Timestamp(selected_date_range[1])
+    # Invoices overlapping the range, found by binary search in the per-park
+    # interval index.
+    filtered_rows = interval.query_intervals(
+        load_invoice_index(),
+        start_filter,
+        end_filter,
+        how="overlap",
+        groups=None if len(selected_parks) == len(parks) else selected_parks,
+    )
+    filtered_df = invoice_df.iloc[filtered_rows]
+    if prorate:
+        fraction = interval.overlap_fraction(
+            filtered_df["start_read_date"],
+            filtered_df["end_read_date"],
+            start_filter,
+            end_filter,
+        )
+        filtered_df = filtered_df.assign(
+            volume=(filtered_df["volume"] * fraction).round(1),
+            estimated_volume=(filtered_df["estimated_volume"] * fraction).round(1),
+        )
+        filtered_df["difference"] = (
+            filtered_df["volume"] - filtered_df["estimated_volume"]
+        )
+else:
+    filtered_df = invoice_df[invoice_df["name"].isin(selected_parks)]
 
 # Display Invoice Data and Estimated Water Need
 st.subheader("Invoice Data and Estimated Water Need")
 # Use .hide_index() to hide the index in the table.
-display_df = filtered_df.copy().rename(
+display_df = filtered_df.drop(columns=["difference_pct", "days"]).rename(
     columns={
         "name": "Park Name",
         "grass_area": "Grass Area",
@@ -66,29 +83,46 @@ display_df = filtered_df.copy().rename(
         "difference": "Difference (m³)",
     }
 )
+display_df["Reading Start Date"] = display_df["Reading Start Date"].dt.date
+display_df["Reading End Date"] = display_df["Reading End Date"].dt.date
 st.dataframe(display_df.style.hide())
 
 # Altair Bar Chart: Actual vs. Estimated Water Volume by Invoice Period
 st.subheader("Actual vs. Estimated Water Volume by Invoice Period")
 
-# Create an invoice period column for the chart (e.g., "2023-05-01 - 2023-05-31").
-chart_df = filtered_df.copy()
-chart_df["Invoice Period"] = (
-    chart_df["start_read_date"].astype(str)
-    + " - "
-    + chart_df["end_read_date"].astype(str)
-)
+# Invoice periods shown per park; consecutive invoices beyond this are merged.
+MAX_PERIODS_SINGLE_PARK = 60
+MAX_PERIODS_PER_FACET = 12
 
-# Melt the data to create a "Type" (actual vs. estimated) for each row.
-chart_data = chart_df.melt(
-    id_vars=["Invoice Period", "name"],
-    value_vars=["volume", "estimated_volume"],
-    var_name="Type",
-    value_name="Volume (m³)",
-)
 
-# Bar chart: If more than one park is selected, facet by park.
-if len(selected_parks) > 1:
+@st.cache_data(show_spinner=False, max_entries=32)
+def invoice_period_chart_spec(chart_df, facet_by_park):
+    """
+    Builds the Vega-Lite spec of the invoice period bar chart.
+
+    Cached on the filtered invoices, so reruns with the same filter selection reuse
+    the spec instead of rebuilding and serializing the chart.
+    """
+    # Cap the bars per park: merged periods keep their summed volumes.
+    chart_df = downsample.bin_invoice_periods(
+        chart_df,
+        MAX_PERIODS_PER_FACET if facet_by_park else MAX_PERIODS_SINGLE_PARK,
+    )
+    # Create an invoice period column for the chart (e.g., "2023-05-01 - 2023-05-31").
+    chart_df["Invoice Period"] = (
+        chart_df["start_read_date"].dt.strftime("%Y-%m-%d")
+        + " - "
+        + chart_df["end_read_date"].dt.strftime("%Y-%m-%d")
+    )
+
+    # Melt the data to create a "Type" (actual vs. estimated) for each row.
+    chart_data = chart_df.melt(
+        id_vars=["Invoice Period", "name", "invoice_count"],
+        value_vars=["volume", "estimated_volume"],
+        var_name="Type",
+        value_name="Volume (m³)",
+    )
+
     bar_chart = (
         alt.Chart(chart_data)
         .mark_bar()
@@ -99,28 +133,34 @@ if len(selected_parks) > 1:
             xOffset=alt.X("Type:N", title="Volume Type"),
             y=alt.Y("Volume (m³):Q", title="Volume (m³)"),
             color=alt.Color("Type:N", title="Volume Type"),
-            tooltip=["name", "Invoice Period", "Type", "Volume (m³)"],
+            tooltip=[
+                "name",
+                "Invoice Period",
+                "Type",
+                "Volume (m³)",
+                alt.Tooltip("invoice_count", title="Invoices"),
+            ],
         )
-        .properties(width=150, height=200)
-        .facet(facet=alt.Facet("name:N", title="Park Name"), columns=2)
     )
-else:
-    bar_chart = (
-        alt.Chart(chart_data)
-        .mark_bar()
-        .encode(
-            x=alt.X(
-                "Invoice Period:N", title="Invoice Period", axis=alt.Axis(labelLimit=0)
-            ),
-            xOffset=alt.X("Type:N", title="Volume Type"),
-            y=alt.Y("Volume (m³):Q", title="Volume (m³)"),
-            color=alt.Color("Type:N", title="Volume Type"),
-            tooltip=["name", "Invoice Period", "Type", "Volume (m³)"],
+    # Bar chart: If more than one park is selected, facet by park.
+    if facet_by_park:
+        bar_chart = bar_chart.properties(width=150, height=200).facet(
+            facet=alt.Facet("name:N", title="Park Name"), columns=2
         )
-        .properties(width=600)
-    )
-
-st.altair_chart(bar_chart, use_container_width=True)
+    else:
+        bar_chart = bar_chart.properties(width=600)
+    return bar_chart.to_dict()
+
+
+st.vega_lite_chart(
+    invoice_period_chart_spec(
+        filtered_df[
+            ["name", "start_read_date", "end_read_date", "volume", "estimated_volume"]
+        ],
+        len(selected_parks) > 1,
+    ),
+    use_container_width=True,
+)
 
 # Display the Difference (Actual - Estimated)
 st.subheader("Difference (Actual - Estimated)")
@@ -129,33 +169,56 @@ st.write(
     "while a negative value indicates lower consumption."
 )
 
-# Create tables sorted by difference.
-diff_sorted_asc = filtered_df.sort_values("difference", ascending=True)[
-    ["name", "start_read_date", "end_read_date", "difference"]
-].rename(
-    columns={
-        "name": "Park Name",
-        "start_read_date": "Reading Start Date",
-        "end_read_date": "Reading End Date",
-        "difference": "Difference (m³)",
-    }
-)
-diff_sorted_desc = filtered_df.sort_values("difference", ascending=False)[
-    ["name", "start_read_date", "end_read_date", "difference"]
-].rename(
-    columns={
+@st.cache_data(show_spinner=False, max_entries=32)
+def difference_rankings(ranking_df, n, per_park, per_m2):
+    """Returns the (least, most) watered invoice tables, cached per filter selection."""
+    columns = {
         "name": "Park Name",
         "start_read_date": "Reading Start Date",
         "end_read_date": "Reading End Date",
         "difference": "Difference (m³)",
+        "difference_per_m2": "Difference (m³/m²)",
     }
+    tables = []
+    for ranked in ranking.rank_differences(
+        ranking_df, n=n, per_park=per_park, per_m2=per_m2
+    ):
+        ranked = ranked[[column for column in columns if column in ranked]]
+        ranked = ranked.rename(columns=columns)
+        ranked["Reading Start Date"] = ranked["Reading Start Date"].dt.date
+        ranked["Reading End Date"] = ranked["Reading End Date"].dt.date
+        tables.append(ranked)
+    return tuple(tables)
+
+
+rank_cols = st.columns(3)
+with rank_cols[0]:
+    rank_count = st.number_input(
+        "Invoices per table", min_value=1, max_value=500, value=10
+    )
+with rank_cols[1]:
+    rank_per_park = st.checkbox(
+        "Rank within each park", help="Show the top invoices of every selected park."
+    )
+with rank_cols[2]:
+    rank_per_m2 = st.checkbox(
+        "Per m² of grass area", help="Rank by the difference per m² (m³/m²)."
+    )
+
+diff_least, diff_most = difference_rankings(
+    filtered_df[
+        ["name", "start_read_date", "end_read_date", "difference", "grass_area"]
+    ],
+    rank_count,
+    rank_per_park,
+    rank_per_m2,
 )
 
 st.markdown("#### Least Watered Invoices (Actual < Estimated)")
-st.dataframe(diff_sorted_asc.style.hide())
+st.dataframe(diff_least.style.hide())
 
 st.markdown("#### Most Watered Invoices (Actual > Estimated)")
-st.dataframe(diff_sorted_desc.style.hide())
+st.dataframe(diff_most.style.hide())
 
 # Detailed Daily Water Need Estimation (Placeholder)
 st.subheader("Detailed Daily Water Need Estimation")
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from util import interval
+
+MEASURES = ["actual_volume", "estimated_volume", "invoice_count"]
+
+
+def build_monthly_cube(invoices):
+    """
+    Aggregates processed invoices into a park × month table.
+
+    Volumes are apportioned to the months an invoice covers in proportion to its
+    days; each invoice is counted once, in the month of its end read date.
+
+    Parameters:
+      - invoices: DataFrame with name, start_read_date, end_read_date, volume,
+        estimated_volume and grass_area columns
+
+    Returns:
+      - DataFrame with columns name, month, actual_volume, estimated_volume,
+        invoice_count and grass_area, one row per park and month with data
+    """
+    rows, months, volumes = interval.apportion_by_month(
+        invoices["start_read_date"],
+        invoices["end_read_date"],
+        invoices[["volume", "estimated_volume"]].to_numpy(),
+    )
+    names = invoices["name"].to_numpy()
+    apportioned = pd.DataFrame(
+        {
+            "name": names[rows],
+            "month": months.astype("datetime64[ns]"),
+            "actual_volume": volumes[:, 0],
+            "estimated_volume": volumes[:, 1],
+            "invoice_count": 0,
+        }
+    )
+    counted = pd.DataFrame(
+        {
+            "name": names,
+            "month": pd.to_datetime(invoices["end_read_date"])
+            .dt.to_period("M")
+            .dt.to_timestamp()
+            .to_numpy(),
+            "actual_volume": 0.0,
+            "estimated_volume": 0.0,
+            "invoice_count": 1,
+        }
+    )
+    cube_df = (
+        pd.concat([apportioned, counted], ignore_index=True)
+        .groupby(["name", "month"], as_index=False)
+        .sum()
+        .round({"actual_volume": 4, "estimated_volume": 4})
+    )
+    grass_area = invoices.drop_duplicates(subset="name").set_index("name")[
+        "grass_area"
+    ]
+    cube_df["grass_area"] = cube_df["name"].map(grass_area)
+    return cube_df
+
+
+def cube_array(cube_df):
+    """
+    Converts the long park × month table into a dense array for slicing.
+
+    Returns:
+      - Tuple (parks, months, values, grass_area) where parks is a list of park
+        names, months is a monthly DatetimeIndex, values has shape
+        (n_parks + 1, n_months, len(MEASURES)) and grass_area has shape
+        (n_parks + 1,). The last row of values and grass_area holds the total
+        over all parks.
+    """
+    parks = sorted(cube_df["name"].unique())
+    months = pd.DatetimeIndex([])
+    if len(cube_df):
+        months = pd.date_range(cube_df["month"].min(), cube_df["month"].max(), freq="MS")
+
+    park_index = pd.Index(parks).get_indexer(cube_df["name"])
+    month_index = months.get_indexer(cube_df["month"])
+    values = np.zeros((len(parks) + 1, len(months), len(MEASURES)))
+    values[park_index, month_index] = cube_df[MEASURES].to_numpy()
+    values[-1] = values[:-1].sum(axis=0)
+
+    grass_area = (
+        cube_df.drop_duplicates(subset="name").set_index("name")["grass_area"]
+    ).reindex(parks).to_numpy(dtype=float)
+    grass_area = np.append(grass_area, grass_area.sum())
+    return parks, months, values, grass_area
+
+
+def month_window(months, start_date, end_date):
+    """Returns the slice of months whose first day lies within [start_date, end_date]."""
+    lo = months.searchsorted(pd.Timestamp(start_date), side="left")
+    hi = months.searchsorted(pd.Timestamp(end_date), side="right")
+    return slice(lo, hi)
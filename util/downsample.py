@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def bin_invoice_periods(
+    invoices, max_periods, group="name", values=("volume", "estimated_volume")
+):
+    """
+    Caps the number of invoice periods per group by merging consecutive invoices.
+
+    Within each group, invoices are ordered by start read date and split into at
+    most max_periods bins of consecutive invoices (groups with fewer invoices keep
+    one bin per invoice). Volumes are summed, so the chart's totals are unchanged.
+
+    Parameters:
+      - invoices: DataFrame with the group column, start_read_date, end_read_date
+        and the value columns
+      - max_periods: Maximum number of periods kept per group
+      - group: Column to bin within (default="name")
+      - values: Columns summed per bin (default=volume and estimated_volume)
+
+    Returns:
+      - DataFrame with one row per bin: the group, the bin's first start and last
+        end read date, the summed values and invoice_count
+    """
+    df = invoices.sort_values([group, "start_read_date"], kind="stable")
+    grouped = df.groupby(group, observed=True, sort=False)
+    position = grouped.cumcount().to_numpy()
+    size = grouped[group].transform("size").to_numpy()
+    period_bin = np.where(size > max_periods, position * max_periods // size, position)
+
+    aggregations = {
+        "start_read_date": ("start_read_date", "min"),
+        "end_read_date": ("end_read_date", "max"),
+        **{value: (value, "sum") for value in values},
+        "invoice_count": ("start_read_date", "size"),
+    }
+    return (
+        df.assign(period_bin=period_bin)
+        .groupby([group, "period_bin"], observed=True, sort=False)
+        .agg(**aggregations)
+        .reset_index()
+        .drop(columns="period_bin")
+    )
@@ -0,0 +1,115 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+# Parsed registries are kept here as Parquet snapshots, keyed by the workbook hash.
+# Set cache_dir=None to always parse the workbook.
+CACHE_DIR = "data/green_area_cache"
+# Zero-based row of the column headers; the rows above hold the sheet title.
+HEADER_ROW = 4
+TEXT_COLUMNS = ["PARK ADI", "ADRES", "MAHALLE"]
+REQUIRED_COLUMNS = ["SIRA NO", "PARK ADI", "ÇİM ALAN"]
+
+
+def _file_hash(path):
+    """Returns the SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_green_area(green_area_path, header_row=HEADER_ROW):
+    """
+    Parses the first sheet of a green-area workbook into a typed registry.
+
+    The sheet is streamed with openpyxl's read-only reader. Only the numbered park
+    rows are kept (rows whose "SIRA NO" is a number). Columns without a header get
+    pandas' "Unnamed: <i>" names.
+
+    Returns:
+      - DataFrame with "SIRA NO" as int, the TEXT_COLUMNS as strings and all other
+        columns as float areas (NaN where empty or not a number)
+    """
+    workbook = openpyxl.load_workbook(green_area_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(min_row=header_row + 1, values_only=True)
+        header = next(rows, ())
+        records = list(rows)
+    finally:
+        workbook.close()
+
+    # Trailing columns without a header or any value are dropped, as read_excel does.
+    width = len(header)
+    while width and header[width - 1] is None and all(
+        len(record) < width or record[width - 1] is None for record in records
+    ):
+        width -= 1
+    columns = [
+        f"Unnamed: {i}" if name is None else str(name).strip()
+        for i, name in enumerate(header[:width])
+    ]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(
+            f"{green_area_path} has no {missing} column(s) in row {header_row + 1}."
+        )
+
+    df = pd.DataFrame(
+        [record[:width] for record in records], columns=columns, dtype=object
+    )
+    # Remove "SIRA NO" rows with non-numeric or na values
+    sira_no = pd.to_numeric(df["SIRA NO"], errors="coerce")
+    df = df[sira_no.notna()].reset_index(drop=True)
+    df["SIRA NO"] = sira_no.dropna().astype(int).to_numpy()
+
+    for column in df.columns.drop("SIRA NO"):
+        if column in TEXT_COLUMNS:
+            values = df[column]
+            df[column] = values.where(values.isna(), values.astype(str)).astype(
+                "string"
+            )
+        else:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+    return df
+
+
+def load_green_area(green_area_path, cache_dir=CACHE_DIR):
+    """
+    Returns a district's green-area registry, parsing the workbook only when it changed.
+
+    The parsed registry is stored as <cache_dir>/<workbook name>-<hash>.parquet.
+    A workbook with a new hash is parsed again and replaces its older snapshots.
+
+    Parameters:
+      - green_area_path: Path of the registry workbook (e.g. "data/ca_green_area.xlsx")
+      - cache_dir: Snapshot directory, or None to always parse the workbook
+
+    Returns:
+      - DataFrame returned by parse_green_area
+    """
+    if cache_dir is None:
+        return parse_green_area(green_area_path)
+
+    stem = os.path.splitext(os.path.basename(green_area_path))[0]
+    snapshot_path = os.path.join(
+        cache_dir, f"{stem}-{_file_hash(green_area_path)[:16]}.parquet"
+    )
+    if os.path.exists(snapshot_path):
+        return pd.read_parquet(snapshot_path)
+
+    df = parse_green_area(green_area_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so readers never see a partial snapshot.
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, snapshot_path)
+    for stale_path in glob.glob(os.path.join(cache_dir, f"{stem}-*.parquet")):
+        if stale_path != snapshot_path:
+            os.remove(stale_path)
+    return df
@@ -0,0 +1,101 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds.
+TIMEOUT = (10, 120)
+# Attempts after the first one for timeouts, connection errors and RETRY_STATUSES.
+MAX_RETRIES = 4
+# First retry delay in seconds; it doubles with every further attempt.
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that at most `rate` of them start per second.
+
+    Thread-safe: threads sharing a limiter take consecutive time slots.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=10):
+    """Returns a Session that keeps up to pool_size connections per host alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retry_delay(attempt, response=None, backoff=BACKOFF_SECONDS):
+    """Returns the server's Retry-After delay if given, else a jittered backoff."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+    delay = min(backoff * 2**attempt, MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def get_json(
+    session,
+    url,
+    params=None,
+    timeout=TIMEOUT,
+    retries=MAX_RETRIES,
+    backoff=BACKOFF_SECONDS,
+    rate_limiter=None,
+):
+    """
+    Sends a GET request and returns the decoded JSON body, retrying transient failures.
+
+    Timeouts, connection errors and the statuses in RETRY_STATUSES are retried
+    with exponential backoff (or after the server's Retry-After); other error
+    statuses raise immediately.
+
+    Parameters:
+      - session: requests.Session to send the request with
+      - url: Request URL
+      - params: Query parameters
+      - timeout: (connect, read) timeouts in seconds (default=TIMEOUT)
+      - retries: Retries after the first attempt (default=MAX_RETRIES)
+      - backoff: First retry delay in seconds (default=BACKOFF_SECONDS)
+      - rate_limiter: Optional RateLimiter every attempt waits for
+
+    Returns:
+      - Decoded JSON body
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(_retry_delay(attempt, backoff=backoff))
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            time.sleep(_retry_delay(attempt, response, backoff))
+            continue
+        response.raise_for_status()  # Raises HTTPError for bad responses
+        return response.json()
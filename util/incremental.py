@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# An invoice is identified by its meter subscription and read period...
+INVOICE_KEY = ["subscription", "start_read_date", "end_read_date"]
+# ...and counts as changed when any of these values differ.
+FINGERPRINT_COLUMNS = INVOICE_KEY + ["volume"]
+
+
+def _normalized(invoices, columns):
+    """Returns the columns as strings and floats so equal invoices hash equally."""
+    normalized = pd.DataFrame(index=invoices.index)
+    for column in columns:
+        if column.endswith("_date"):
+            normalized[column] = pd.to_datetime(invoices[column]).dt.strftime(
+                "%Y-%m-%d"
+            )
+        elif column == "volume":
+            normalized[column] = pd.to_numeric(
+                invoices[column], errors="coerce"
+            ).astype(float)
+        else:
+            normalized[column] = invoices[column].astype(str).str.strip()
+    return normalized
+
+
+def fingerprint_invoices(invoices):
+    """
+    Hashes each invoice row on its subscription, read dates and volume.
+
+    Returns:
+      - uint64 array with one fingerprint per row
+    """
+    normalized = _normalized(invoices, FINGERPRINT_COLUMNS)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def hash_inputs(*parts):
+    """
+    Hashes the inputs an assessment depends on besides the invoices themselves.
+
+    Parameters:
+      - parts: DataFrames, arrays or scalars (e.g. a park's grass area and its
+        daily water need)
+
+    Returns:
+      - Hex digest that changes whenever any part's values change
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            values = pd.util.hash_pandas_object(part, index=False).to_numpy()
+        else:
+            values = np.ascontiguousarray(part)
+        digest.update(str((values.dtype, values.shape)).encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def load_state(path):
+    """
+    Returns the state of the previous run: the fingerprint of every input invoice
+    with the hash of the inputs it was assessed with.
+
+    Returns:
+      - DataFrame with fingerprint and inputs_hash columns (empty if no state yet)
+    """
+    if os.path.exists(path):
+        state = pd.read_parquet(path)
+        if "inputs_hash" in state:
+            return state
+    return pd.DataFrame(
+        {"fingerprint": pd.Series([], dtype="uint64"), "inputs_hash": ""}
+    )
+
+
+def build_state(fingerprints, inputs_hashes):
+    """Returns the state recording each invoice as assessed with its inputs_hash."""
+    return pd.DataFrame(
+        {"fingerprint": fingerprints, "inputs_hash": inputs_hashes}
+    ).drop_duplicates(ignore_index=True)
+
+
+def save_state(path, state):
+    """Stores a state returned by build_state."""
+    state.to_parquet(path, index=False)
+
+
+def stale_invoices(fingerprints, inputs_hashes, state):
+    """
+    Flags the invoices to assess: those not in the state with the same inputs hash.
+
+    Returns:
+      - Boolean array, True for new or changed invoices and for invoices whose
+        inputs (e.g. their park's match) changed since they were assessed
+    """
+    current = pd.MultiIndex.from_arrays(
+        [np.asarray(fingerprints, dtype="uint64"), np.asarray(inputs_hashes, dtype=object)]
+    )
+    assessed = pd.MultiIndex.from_frame(state[["fingerprint", "inputs_hash"]])
+    return ~current.isin(assessed)
+
+
+def merge_assessed(existing, assessed, fingerprints, kept_fingerprints):
+    """
+    Rebuilds the output from the previous output and the newly assessed invoices.
+
+    Rows of the existing output are kept only if their fingerprint is among
+    kept_fingerprints, so rows of invoices that were corrected (new read dates
+    or volume), removed from the input or reassessed now are dropped.
+
+    Parameters:
+      - existing: Output of the previous run
+      - assessed: Newly assessed invoices
+      - fingerprints: Fingerprints of the current input invoices, in input order
+      - kept_fingerprints: Fingerprints of the input invoices that were not
+        reassessed
+
+    Returns:
+      - DataFrame of the kept and assessed rows in input order, as a full run
+        would write it
+    """
+    kept = existing[np.isin(fingerprint_invoices(existing), kept_fingerprints)]
+    frames = [frame for frame in (kept, assessed) if not frame.empty] or [kept]
+    merged = pd.concat(frames, ignore_index=True)
+    first_position = pd.Series(np.arange(len(fingerprints)), index=fingerprints)
+    first_position = first_position[~first_position.index.duplicated()]
+    order = first_position.reindex(fingerprint_invoices(merged)).to_numpy()
+    return merged.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
@@ -0,0 +1,55 @@
+import pandas as pd
+
+# Columns of the municipal invoice export needed for the assessment, with their dtypes.
+INVOICE_DTYPES = {
+    "subscription": str,
+    "district": str,
+    "name": str,
+    "volume": float,
+    "start_read_date": str,
+    "end_read_date": str,
+}
+
+
+def read_district_invoices(path, district, name_prefix=None, chunksize=100_000):
+    """
+    Reads the invoices of one district from the municipal export in chunks.
+
+    Only the needed columns are parsed, rows of other districts are dropped per
+    chunk and names are cleaned per chunk, so memory stays bounded by the chunk
+    size plus the selected district's invoices.
+
+    Parameters:
+      - path: Path of the invoice export (e.g. "data/all_invoice.csv")
+      - district: District to keep (e.g. "ÇANKAYA")
+      - name_prefix: Text removed from invoice names (e.g. "ÇANKAYA BELEDİYESİ")
+      - chunksize: Number of rows parsed at a time (default=100_000)
+
+    Returns:
+      - DataFrame with subscription, district, name, volume and datetime64
+        start_read_date and end_read_date columns
+    """
+    # Header names may carry stray whitespace; select and type by stripped name.
+    header = pd.read_csv(path, nrows=0).columns
+    raw_names = {
+        column.strip(): column for column in header if column.strip() in INVOICE_DTYPES
+    }
+    reader = pd.read_csv(
+        path,
+        usecols=list(raw_names.values()),
+        dtype={raw_names[name]: dtype for name, dtype in INVOICE_DTYPES.items()},
+        chunksize=chunksize,
+    )
+
+    chunks = []
+    for chunk in reader:
+        chunk.columns = chunk.columns.str.strip()
+        chunk = chunk[chunk["district"] == district].copy()
+        if name_prefix:
+            chunk["name"] = chunk["name"].str.replace(name_prefix, "", regex=False)
+        chunk["name"] = chunk["name"].str.strip()
+        chunk["start_read_date"] = pd.to_datetime(chunk["start_read_date"])
+        chunk["end_read_date"] = pd.to_datetime(chunk["end_read_date"])
+        chunks.append(chunk)
+
+    return pd.concat(chunks, ignore_index=True)[list(INVOICE_DTYPES)]
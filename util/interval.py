@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_days(dates):
+    """Converts dates (date objects, strings or datetime64) to a datetime64[D] array."""
+    if isinstance(dates, np.ndarray) and dates.dtype.kind == "M":
+        return dates.astype("datetime64[D]").ravel()
+    return pd.to_datetime(pd.Series(np.asarray(dates).ravel())).to_numpy("datetime64[D]")
+
+
+def build_prefix_sum(dates, values):
+    """
+    Builds a cumulative-sum table over a daily series so that the sum over any
+    date interval can be answered with two lookups.
+
+    Missing (NaN) days count as zero, as a masked .sum() skips them; otherwise one
+    missing day would poison every later prefix entry.
+
+    Parameters:
+      - dates: Sequence of daily dates, sorted ascending
+      - values: Daily values, shape (n_days,) or (n_series, n_days)
+
+    Returns:
+      - Tuple (days, prefix) where days is a datetime64[D] array of length n_days
+        and prefix has a leading zero column, i.e. shape (..., n_days + 1)
+    """
+    days = _to_days(dates)
+    values = np.asarray(values, dtype=float)
+    if values.shape[-1] != len(days):
+        raise ValueError(
+            f"values has {values.shape[-1]} days but dates has {len(days)} entries."
+        )
+    if len(days) > 1 and (np.diff(days) <= np.timedelta64(0, "D")).any():
+        raise ValueError("dates must be strictly increasing.")
+
+    prefix = np.zeros(values.shape[:-1] + (len(days) + 1,))
+    np.cumsum(np.nan_to_num(values, nan=0.0), axis=-1, out=prefix[..., 1:])
+    return days, prefix
+
+
+def interval_sums(days, prefix, start_dates, end_dates, rows=None):
+    """
+    Sums the daily series over inclusive [start_date, end_date] intervals.
+
+    Days outside the range covered by the table contribute nothing, exactly as
+    a boolean date mask over the daily table would.
+
+    Parameters:
+      - days: datetime64[D] array returned by build_prefix_sum
+      - prefix: Cumulative table returned by build_prefix_sum
+      - start_dates: Interval start dates (inclusive)
+      - end_dates: Interval end dates (inclusive)
+      - rows: Optional series row per interval for a 2-D table (e.g. location index)
+
+    Returns:
+      - Array of interval sums with shape (..., n_intervals), or (n_intervals,)
+        when rows is given
+    """
+    lo = np.searchsorted(days, _to_days(start_dates), side="left")
+    hi = np.searchsorted(days, _to_days(end_dates), side="right")
+    # Reversed intervals select no days under a mask, so they sum to zero.
+    hi = np.maximum(hi, lo)
+    if rows is not None:
+        rows = np.asarray(rows)
+        return prefix[rows, hi] - prefix[rows, lo]
+    return prefix[..., hi] - prefix[..., lo]
+
+
+def month_segments(start_dates, end_dates):
+    """
+    Splits inclusive date intervals at calendar month boundaries.
+
+    Parameters:
+      - start_dates: Interval start dates (inclusive)
+      - end_dates: Interval end dates (inclusive)
+
+    Returns:
+      - Tuple (rows, months, segment_start, segment_end) with one entry per
+        (interval, month) overlap: rows indexes the interval, months is a
+        datetime64[M] array and the segment bounds are inclusive datetime64[D]
+        dates. Intervals that end before they start have no segments.
+    """
+    start = _to_days(start_dates)
+    end = _to_days(end_dates)
+
+    start_month = start.astype("datetime64[M]")
+    month_count = (end.astype("datetime64[M]") - start_month).astype(int) + 1
+    month_count[end < start] = 0
+
+    # One entry per month touched by each interval.
+    rows = np.repeat(np.arange(len(start)), month_count)
+    first_entry = np.cumsum(month_count) - month_count
+    offset = np.arange(len(rows)) - np.repeat(first_entry, month_count)
+    months = start_month[rows] + offset
+
+    month_first = months.astype("datetime64[D]")
+    month_last = (months + 1).astype("datetime64[D]") - 1
+    segment_start = np.maximum(start[rows], month_first)
+    segment_end = np.minimum(end[rows], month_last)
+    return rows, months, segment_start, segment_end
+
+
+def apportion_by_month(start_dates, end_dates, values):
+    """
+    Splits interval totals across the calendar months they cover, in proportion
+    to the number of days of the interval falling in each month.
+
+    This gives the same monthly totals as spreading each value evenly over its
+    days and summing per month, without materializing one row per day.
+
+    Parameters:
+      - start_dates: Interval start dates (inclusive)
+      - end_dates: Interval end dates (inclusive)
+      - values: Interval totals, shape (n_intervals,) or (n_intervals, n_values)
+
+    Returns:
+      - Tuple (rows, months, shares) with one entry per (interval, month) overlap:
+        rows indexes the interval, months is a datetime64[M] array and shares holds
+        the apportioned values with the trailing shape of values. Intervals that
+        end before they start are skipped.
+    """
+    start = _to_days(start_dates)
+    end = _to_days(end_dates)
+    values = np.asarray(values, dtype=float)
+
+    interval_days = (end - start).astype(int) + 1
+    rows, months, segment_start, segment_end = month_segments(start, end)
+    overlap_days = (segment_end - segment_start).astype(int) + 1
+
+    fraction = overlap_days / interval_days[rows]
+    shares = values[rows] * fraction.reshape((-1,) + (1,) * (values.ndim - 1))
+    return rows, months, shares
+
+
+def build_interval_index(start_dates, end_dates, groups=None):
+    """
+    Sorts intervals by start date, overall and per group, for range queries.
+
+    Parameters:
+      - start_dates: Interval start dates (inclusive)
+      - end_dates: Interval end dates (inclusive)
+      - groups: Optional group label per interval (e.g. park name)
+
+    Returns:
+      - Dict with rows, starts and ends (datetime64[D]) laid out as consecutive
+        segments sorted by start date: the whole set first, then one segment per
+        group. segments maps None (all intervals) and every group label to the
+        segment's (first, stop, longest interval in days, most days an interval
+        ends before its start).
+    """
+    start = _to_days(start_dates)
+    end = _to_days(end_dates)
+    lengths = (end - start).astype("timedelta64[D]")
+
+    codes, labels = pd.factorize(
+        pd.Series(np.zeros(len(start), dtype=int) if groups is None else groups)
+    )
+    # Segment 0 holds all intervals; segment k + 1 holds group k.
+    segment_rows = [np.argsort(start, kind="stable")]
+    order = np.lexsort((start, codes))
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    segment_rows += np.split(order[codes[order] >= 0], np.cumsum(counts)[:-1])
+    keys = [None] + ([] if groups is None else list(labels))
+
+    rows = np.concatenate(segment_rows) if segment_rows else np.array([], dtype=int)
+    segments = {}
+    first = 0
+    zero = np.timedelta64(0, "D")
+    for key, seg in zip(keys, segment_rows):
+        longest = lengths[seg].max() if len(seg) else zero
+        shortest = lengths[seg].min() if len(seg) else zero
+        segments[key] = (
+            first,
+            first + len(seg),
+            max(longest, zero),
+            max(-shortest, zero),
+        )
+        first += len(seg)
+    return {"rows": rows, "starts": start[rows], "ends": end[rows], "segments": segments}
+
+
+def query_intervals(index, start_date, end_date, how="overlap", groups=None):
+    """
+    Finds the intervals overlapping or contained in a date range with binary search.
+
+    Intervals are taken as [start, end] with both days included, as by the
+    dashboard filters: "overlap" keeps end >= start_date and start <= end_date,
+    "contained" keeps start >= start_date and end <= end_date. Only the slice of
+    each segment whose start dates can qualify is scanned. Intervals ending
+    before they start are kept under the same conditions, as by a boolean mask.
+
+    Parameters:
+      - index: Dict returned by build_interval_index
+      - start_date: First day of the range
+      - end_date: Last day of the range
+      - how: "overlap" or "contained" (default="overlap")
+      - groups: Group labels to search, or None for all intervals
+
+    Returns:
+      - Sorted array of the matching rows (positions in the indexed input)
+    """
+    if how not in ("overlap", "contained"):
+        raise ValueError(f"Unknown how={how!r}; expected 'overlap' or 'contained'.")
+    range_start = np.datetime64(pd.Timestamp(start_date), "D")
+    range_end = np.datetime64(pd.Timestamp(end_date), "D")
+    keys = [None] if groups is None else dict.fromkeys(groups)
+
+    matches = []
+    for key in keys:
+        if key not in index["segments"]:
+            continue
+        first, stop, longest, reversal = index["segments"][key]
+        starts = index["starts"][first:stop]
+        if how == "overlap":
+            # Overlapping intervals start at most `longest` days before the range.
+            lowest_start, highest_start = range_start - longest, range_end
+        else:
+            # Contained intervals end in the range, so only reversed ones (end
+            # before start) can start after it, by at most `reversal` days.
+            lowest_start, highest_start = range_start, range_end + reversal
+        lo = first + np.searchsorted(starts, lowest_start, side="left")
+        hi = first + np.searchsorted(starts, highest_start, side="right")
+        ends = index["ends"][lo:hi]
+        keep = ends >= range_start if how == "overlap" else ends <= range_end
+        matches.append(index["rows"][lo:hi][keep])
+    if not matches:
+        return np.array([], dtype=int)
+    return np.sort(np.concatenate(matches))
+
+
+def overlap_fraction(start_dates, end_dates, start_date, end_date):
+    """
+    Returns the share of each interval's days falling inside [start_date, end_date].
+
+    Used to prorate invoice volumes that only partly overlap a date range.
+    """
+    start = _to_days(start_dates)
+    end = _to_days(end_dates)
+    range_start = np.datetime64(pd.Timestamp(start_date), "D")
+    range_end = np.datetime64(pd.Timestamp(end_date), "D")
+    interval_days = (end - start).astype(int) + 1
+    overlap_days = (
+        np.minimum(end, range_end) - np.maximum(start, range_start)
+    ).astype(int) + 1
+    return np.clip(overlap_days / np.maximum(interval_days, 1), 0, 1)
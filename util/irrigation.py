@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# The watering season is June–October unless a district or park says otherwise.
+DEFAULT_SEASON_MONTHS = (6, 7, 8, 9, 10)
+
+
+def parse_months(text):
+    """
+    Parses a month list such as "6-10", "4,5,6" or "11-2" into a tuple of months.
+
+    Ranges are inclusive and may wrap around the new year.
+    """
+    months = []
+    for part in str(text).split(","):
+        first, _, last = part.strip().partition("-")
+        first, last = int(first), int(last or first)
+        if not (1 <= first <= 12 and 1 <= last <= 12):
+            raise ValueError(f"Months must be between 1 and 12: {text!r}")
+        if last < first:
+            months.extend(list(range(first, 13)) + list(range(1, last + 1)))
+        else:
+            months.extend(range(first, last + 1))
+    return tuple(months)
+
+
+def parse_kc(text):
+    """
+    Parses a crop coefficient: one value ("0.8") or 12 monthly values, January first.
+    """
+    values = [float(value) for value in str(text).split(",")]
+    if len(values) == 1:
+        return values[0]
+    if len(values) != 12:
+        raise ValueError(f"Expected one kc value or 12 monthly values: {text!r}")
+    return tuple(values)
+
+
+def monthly_calendar(kc=0.8, season_months=DEFAULT_SEASON_MONTHS):
+    """
+    Builds the monthly irrigation factors of one calendar.
+
+    Parameters:
+      - kc: Crop coefficient, either one value or a curve of 12 monthly values
+        (January first)
+      - season_months: Months of the watering season (e.g. (6, 7, 8, 9, 10))
+
+    Returns:
+      - Array of shape (12,) holding kc in season months and 0 outside them
+    """
+    kc_curve = np.broadcast_to(np.asarray(kc, dtype=float), (12,))
+    in_season = np.isin(np.arange(1, 13), list(season_months))
+    return np.where(in_season, kc_curve, 0.0)
+
+
+def read_park_calendars(path):
+    """
+    Reads the optional per-park irrigation calendar table (None if missing).
+
+    The CSV has a PARK ADI column and optional season_months (e.g. "4-10") and
+    kc (one value or 12 comma-separated monthly values) columns; empty cells fall
+    back to the district's calendar.
+    """
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype={"season_months": str, "kc": str}).drop_duplicates(
+        subset="PARK ADI"
+    )
+
+
+def park_calendars(
+    park_names,
+    kc=0.8,
+    season_months=DEFAULT_SEASON_MONTHS,
+    park_calendars_df=None,
+):
+    """
+    Returns the monthly irrigation factors of every park.
+
+    Parameters:
+      - park_names: Park names, one per row
+      - kc: Default crop coefficient or monthly kc curve
+      - season_months: Default watering season
+      - park_calendars_df: Table returned by read_park_calendars, or None
+
+    Returns:
+      - Array of shape (n_parks, 12)
+    """
+    calendars = np.tile(monthly_calendar(kc, season_months), (len(park_names), 1))
+    if park_calendars_df is None:
+        return calendars
+
+    rows = pd.Index(park_calendars_df["PARK ADI"]).get_indexer(park_names)
+    for park, row in enumerate(rows):
+        if row < 0:
+            continue
+        entry = park_calendars_df.iloc[row]
+        park_season = entry.get("season_months")
+        park_kc = entry.get("kc")
+        calendars[park] = monthly_calendar(
+            kc if pd.isna(park_kc) else parse_kc(park_kc),
+            season_months if pd.isna(park_season) else parse_months(park_season),
+        )
+    return calendars
+
+
+def daily_factors(calendars, dates):
+    """
+    Expands monthly factors onto a daily date axis.
+
+    Returns:
+      - Array of shape (n_calendars, n_days)
+    """
+    month_index = pd.DatetimeIndex(dates).month.to_numpy() - 1
+    return np.asarray(calendars)[:, month_index]
+
+
+def apply_calendars(et_0, location_index, calendars, dates):
+    """
+    Converts daily ET0 into the water need per m² under each park's calendar.
+
+    Parks sharing a weather location and a calendar share a row of the result,
+    so the work grows with the distinct (location, calendar) pairs only.
+
+    Parameters:
+      - et_0: Daily ET0 in mm, shape (n_locations, n_days)
+      - location_index: Row of et_0 for every park
+      - calendars: Monthly factors of every park, shape (n_parks, 12)
+      - dates: Days of the columns of et_0
+
+    Returns:
+      - Tuple (row_index, water_need) where row_index maps every park to a row of
+        water_need, of shape (n_rows, n_days) in m³ per m²
+    """
+    unique_calendars, calendar_index = np.unique(
+        np.asarray(calendars, dtype=float).reshape(-1, 12), axis=0, return_inverse=True
+    )
+    pairs = np.column_stack([np.asarray(location_index), calendar_index.ravel()])
+    unique_pairs, row_index = np.unique(pairs, axis=0, return_inverse=True)
+
+    factors = daily_factors(unique_calendars, dates)[unique_pairs[:, 1]]
+    # Archive days without data yet are NaN; they need no water rather than
+    # turning 0 * NaN into NaN outside the season.
+    et_0 = np.nan_to_num(np.asarray(et_0, dtype=float)[unique_pairs[:, 0]], nan=0.0)
+    water_need = (et_0 * factors / 1000).round(decimals=4)
+    return row_index.ravel(), water_need
@@ -0,0 +1,172 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from util import similarity
+
+INDEX_DIR = "data/name_match_index"
+# Manual matches: columns name_2 (invoice name) and name_1 (registry park name).
+# An empty name_1 keeps the invoice name from ever being matched.
+OVERRIDES_PATH = "data/ca_name_overrides.csv"
+
+MATCH_COLUMNS = ["name_1", "name_2", "score"]
+# Bumped when stored matches are no longer comparable, so old indexes are rebuilt.
+INDEX_FORMAT = 2
+
+
+def build_index(registry_names, mode="turkish"):
+    """
+    Returns an empty index for the registry park names.
+
+    Parameters:
+      - registry_names: Park names of the green-area registry
+      - mode: Feature mode, one of similarity.MATCH_MODES (default="turkish")
+
+    Returns:
+      - Index dict with the mode, the sorted registry names and an empty table of
+        matches
+    """
+    return {
+        "mode": mode,
+        "registry": sorted(set(registry_names)),
+        "matches": pd.DataFrame(columns=MATCH_COLUMNS),
+    }
+
+
+def save_index(index, index_dir=INDEX_DIR):
+    """Writes the registry names and known matches under index_dir."""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "index.json"), "w") as f:
+        json.dump({"mode": index["mode"], "format": INDEX_FORMAT}, f)
+    pd.DataFrame({"name": index["registry"]}).to_parquet(
+        os.path.join(index_dir, "registry.parquet"), index=False
+    )
+    index["matches"].to_parquet(os.path.join(index_dir, "matches.parquet"), index=False)
+
+
+def load_index(registry_names, mode="turkish", index_dir=INDEX_DIR):
+    """
+    Loads the stored index, or builds a new one if there is none or it is stale.
+
+    The stored index is reused only if it was written in the current format with
+    the same mode and the same registry names; otherwise all invoice names are
+    matched again.
+    """
+    index_file = os.path.join(index_dir, "index.json")
+    if not os.path.exists(index_file):
+        return build_index(registry_names, mode)
+
+    with open(index_file) as f:
+        stored = json.load(f)
+    registry = pd.read_parquet(os.path.join(index_dir, "registry.parquet"))["name"]
+    if (
+        stored.get("format") != INDEX_FORMAT
+        or stored["mode"] != mode
+        or registry.tolist() != sorted(set(registry_names))
+    ):
+        return build_index(registry_names, mode)
+
+    return {
+        "mode": mode,
+        "registry": registry.tolist(),
+        "matches": pd.read_parquet(os.path.join(index_dir, "matches.parquet")),
+    }
+
+
+def update_matches(index, invoice_names, chunk_size=similarity.CHUNK_SIZE):
+    """
+    Matches the invoice names again if any of them is not yet in the index.
+
+    The TF-IDF weights depend on every name they are fitted on, so a new name
+    changes the scores of the known ones. The vectorizer is therefore refitted
+    on the registry and all invoice names seen so far, and every one of them gets
+    its most similar registry park name, with the same score as
+    similarity.best_matches gives that pair. Names sharing no term with the
+    registry get an empty park name and score 0.
+
+    Returns:
+      - Number of new names
+    """
+    known = list(index["matches"]["name_2"])
+    known_set = set(known)
+    new_names = [name for name in dict.fromkeys(invoice_names) if name not in known_set]
+    if not new_names:
+        return 0
+
+    names = known + new_names
+    best = (
+        similarity.top_k_matches(
+            names, index["registry"], k=1, chunk_size=chunk_size, mode=index["mode"]
+        )
+        .set_index("name_1")
+        .reindex(names)
+    )
+    index["matches"] = pd.DataFrame(
+        {
+            "name_1": best["name_2"].to_numpy(dtype=object),
+            "name_2": names,
+            "score": best["score"].fillna(0.0).to_numpy(),
+        }
+    )
+    return len(new_names)
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    """Returns the manual matches as a DataFrame with name_1 and name_2 (empty if no file)."""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["name_1", "name_2"])
+    overrides = pd.read_csv(path, usecols=["name_1", "name_2"], dtype=str)
+    return overrides.drop_duplicates(subset="name_2", keep="last")
+
+
+def match_invoice_names(
+    registry_names,
+    invoice_names,
+    mode="turkish",
+    index_dir=INDEX_DIR,
+    overrides_path=OVERRIDES_PATH,
+):
+    """
+    Returns the registry park matched to every invoice name, using the stored index.
+
+    While no new invoice name appears, the stored matches are reused without
+    scoring; otherwise all names are matched again (see update_matches) and the
+    updated index is written back. Manual overrides replace the automatic match
+    with score 1 (or score 0 and no park if name_1 is empty).
+
+    Parameters:
+      - registry_names: Park names of the green-area registry
+      - invoice_names: Names on the invoices
+      - mode: Feature mode, one of similarity.MATCH_MODES (default="turkish")
+      - index_dir: Directory of the stored index (default=INDEX_DIR)
+      - overrides_path: CSV of manual matches (default=OVERRIDES_PATH)
+
+    Returns:
+      - DataFrame with columns name_1, name_2, score and source ("auto" or
+        "manual"), one row per distinct invoice name, sorted by score descending
+    """
+    index = load_index(registry_names, mode, index_dir)
+    if update_matches(index, invoice_names):
+        save_index(index, index_dir)
+
+    matches = (
+        index["matches"]
+        .drop_duplicates(subset="name_2")
+        .set_index("name_2")
+        .reindex(pd.unique(pd.Series(invoice_names)))
+    )
+    matches["source"] = "auto"
+
+    overrides = load_overrides(overrides_path).set_index("name_2")["name_1"]
+    overrides = overrides[overrides.index.isin(matches.index)]
+    matches.loc[overrides.index, "name_1"] = overrides
+    matches.loc[overrides.index, "score"] = np.where(overrides.notna(), 1.0, 0.0)
+    matches.loc[overrides.index, "source"] = "manual"
+
+    matches = matches.rename_axis("name_2").reset_index()
+    matches = matches[MATCH_COLUMNS + ["source"]]
+    matches.sort_values("score", ascending=False, inplace=True, kind="stable")
+    matches.reset_index(drop=True, inplace=True)
+    return matches
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import ContextDecorator
+from datetime import datetime, timezone
+
+# Spans are appended as JSON lines to this file when the variable is set.
+LOG_ENV = "PERF_LOG"
+# Set to "1" to also record the peak traced memory of every span (slower).
+TRACE_MEMORY_ENV = "PERF_TRACE_MEMORY"
+
+_local = threading.local()
+_logger = logging.getLogger("perf")
+_logger.propagate = False
+_log_path = None
+
+
+def _state():
+    """Returns this thread's stack of open spans and list of active collectors."""
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        _local.collectors = []
+    return _local
+
+
+def _log(record):
+    """Writes a span record to the JSON log, if one is configured."""
+    global _log_path
+    path = os.environ.get(LOG_ENV)
+    if not path:
+        return
+    if path != _log_path:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+        _logger.addHandler(logging.FileHandler(path, encoding="utf-8"))
+        _logger.setLevel(logging.INFO)
+        _log_path = path
+    _logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class timed(ContextDecorator):
+    """
+    Times a block or function and records it as a span.
+
+    Usable as a context manager (with timed("pipeline.load"): ...) or as a
+    decorator (@timed("weather.fetch_weather_data")). Spans nest: each record
+    names its parent span. When PERF_TRACE_MEMORY=1, the peak traced memory
+    reached inside the span is recorded too.
+
+    Parameters:
+      - name: Span name, dotted by component (e.g. "app.render")
+      - fields: Extra values stored with the record (e.g. district="ÇANKAYA")
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        state = _state()
+        trace_memory = os.environ.get(TRACE_MEMORY_ENV) == "1"
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if tracemalloc.is_tracing():
+            # The traced peak is global: hand the peak so far to the enclosing
+            # span before resetting it for this one.
+            current, peak = tracemalloc.get_traced_memory()
+            if state.stack:
+                parent = state.stack[-1]
+                parent["peak"] = max(parent["peak"], peak - parent["base"])
+            tracemalloc.reset_peak()
+            base = current
+        else:
+            base = None
+        state.stack.append(
+            {"name": self.name, "start": time.perf_counter(), "base": base, "peak": 0}
+        )
+        return self
+
+    def __exit__(self, *exc):
+        state = _state()
+        span = state.stack.pop()
+        seconds = time.perf_counter() - span["start"]
+
+        peak_mib = None
+        if span["base"] is not None and tracemalloc.is_tracing():
+            peak = max(span["peak"], tracemalloc.get_traced_memory()[1] - span["base"])
+            peak_mib = round(peak / 2**20, 3)
+            if state.stack and state.stack[-1]["base"] is not None:
+                parent = state.stack[-1]
+                parent["peak"] = max(
+                    parent["peak"], peak + span["base"] - parent["base"]
+                )
+
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "span": self.name,
+            "parent": state.stack[-1]["name"] if state.stack else None,
+            "seconds": round(seconds, 6),
+            "peak_mib": peak_mib,
+            "pid": os.getpid(),
+            **self.fields,
+        }
+        for collector in state.collectors:
+            collector.append(record)
+        _log(record)
+        return False
+
+
+class Phases:
+    """
+    Times consecutive phases of straight-line code, such as a Streamlit script.
+
+    start(name) ends the running phase and opens the next one; stop() ends the
+    last one. All spans recorded in this thread meanwhile, including nested
+    ones, are kept in records.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.records = []
+        self._current = None
+        _state().collectors.append(self.records)
+
+    def start(self, name):
+        self._close()
+        self._current = timed(f"{self.prefix}.{name}")
+        self._current.__enter__()
+
+    def stop(self):
+        self._close()
+        state = _state()
+        state.collectors = [c for c in state.collectors if c is not self.records]
+        return self.records
+
+    def _close(self):
+        if self._current is not None:
+            self._current.__exit__(None, None, None)
+            self._current = None
+
+
+def show_panel(records):
+    """
+    Renders span records as a collapsed Streamlit panel.
+
+    Only shown when the page URL carries ?perf=1, so it stays hidden from users.
+    """
+    import pandas as pd
+    import streamlit as st
+
+    if st.query_params.get("perf") != "1":
+        return
+    with st.expander("perf", expanded=False):
+        df = pd.DataFrame(records, columns=["span", "parent", "seconds", "peak_mib"])
+        st.dataframe(df, use_container_width=True, hide_index=True)
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def _extreme_positions(values, n, largest):
+    """Returns the positions of the n smallest (or largest) values, in rank order."""
+    n = min(n, len(values))
+    if n == 0:
+        return np.array([], dtype=int)
+    keys = -values if largest else values
+    # Partial selection: only the n selected values are sorted.
+    selected = np.argpartition(keys, n - 1)[:n]
+    return selected[np.argsort(keys[selected], kind="stable")]
+
+
+def rank_differences(invoices, n=10, per_park=False, per_m2=False):
+    """
+    Returns the invoices with the lowest and highest actual - estimated difference.
+
+    Only the top and bottom n are selected (argpartition, or nsmallest/nlargest per
+    park), instead of sorting all invoices.
+
+    Parameters:
+      - invoices: DataFrame with name, difference and grass_area columns
+      - n: Number of invoices per side, or per park and side with per_park
+      - per_park: Rank within each park instead of across all invoices
+      - per_m2: Rank by difference per m² of grass area (m³/m²); invoices without
+        a grass area are left out
+
+    Returns:
+      - Tuple (lowest, highest) of DataFrames ordered from the most extreme
+        invoice (grouped by park with per_park), with a difference_per_m2 column
+        when per_m2 is set
+    """
+    df = invoices
+    metric = "difference"
+    if per_m2:
+        grass_area = df["grass_area"].where(df["grass_area"] > 0)
+        df = df.assign(difference_per_m2=df["difference"] / grass_area).dropna(
+            subset=["difference_per_m2"]
+        )
+        metric = "difference_per_m2"
+
+    if per_park:
+        grouped = df.groupby("name", observed=True)[metric]
+        lowest = df.loc[grouped.nsmallest(n).index.get_level_values(-1)]
+        highest = df.loc[grouped.nlargest(n).index.get_level_values(-1)]
+        return lowest, highest
+
+    values = df[metric].to_numpy(dtype=float)
+    lowest = df.iloc[_extreme_positions(values, n, largest=False)]
+    highest = df.iloc[_extreme_positions(values, n, largest=True)]
+    return lowest, highest
@@ -0,0 +1,153 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from util import interval, irrigation
+
+SCENARIO_COLUMNS = ["kc", "season_months", "efficiency", "score_threshold"]
+# Working memory of the float64 arrays per block of invoices in scenario_volumes.
+BLOCK_BYTES = 64 * 2**20
+
+
+def scenario_grid(
+    kc=(0.8,),
+    season_months=(irrigation.DEFAULT_SEASON_MONTHS,),
+    efficiency=(1.0,),
+    score_threshold=(0.95,),
+):
+    """
+    Builds every combination of the given parameter values.
+
+    Parameters:
+      - kc: Crop coefficients; each one value or 12 monthly values
+      - season_months: Watering seasons, each a tuple of months
+      - efficiency: Irrigation efficiencies; the water applied is the need
+        divided by the efficiency
+      - score_threshold: Minimum name similarity for an invoice to be assessed
+
+    Returns:
+      - DataFrame with one row per scenario and the columns SCENARIO_COLUMNS
+    """
+    return pd.DataFrame(
+        itertools.product(kc, season_months, efficiency, score_threshold),
+        columns=SCENARIO_COLUMNS,
+    )
+
+
+def scenario_volumes(et_0, dates, invoices, scenarios, block_bytes=BLOCK_BYTES):
+    """
+    Estimates the volume of every invoice under every scenario.
+
+    The pipeline rounds the daily water need to 4 decimals, which makes it depend
+    on the kc value and not just scale with it. So the daily need is computed once
+    per distinct kc value of the scenarios and summed over every invoice period by
+    month of year; each scenario then only picks and adds 12 of these sums. With
+    the pipeline's settings, the result equals its estimated_volume.
+
+    Invoices are evaluated in blocks, grouped by location, so the float64 working
+    arrays (per-factor monthly sums and per-scenario needs) stay within
+    block_bytes and each block only builds prefix sums for its own locations.
+    Only the float32 result grows with scenarios × invoices.
+
+    Parameters:
+      - et_0: Daily ET0 in mm, shape (n_locations, n_days)
+      - dates: Days of the columns of et_0
+      - invoices: DataFrame with start_read_date, end_read_date, location (row of
+        et_0), grass_area and score columns
+      - scenarios: DataFrame returned by scenario_grid
+      - block_bytes: Working memory per block of invoices (default=BLOCK_BYTES)
+
+    Returns:
+      - float32 array of shape (n_scenarios, n_invoices) with the estimated volume
+        in m³, NaN where the invoice's name score is not above the threshold
+    """
+    calendars = np.array(
+        [
+            irrigation.monthly_calendar(kc, season)
+            for kc, season in zip(scenarios["kc"], scenarios["season_months"])
+        ]
+    )
+    factors, factor_index = np.unique(calendars, return_inverse=True)
+    # Scenarios differing only in efficiency or threshold share a calendar.
+    calendar_factors, calendar_index = np.unique(
+        factor_index.reshape(calendars.shape), axis=0, return_inverse=True
+    )
+    calendar_index = calendar_index.ravel()
+
+    et_0 = np.nan_to_num(np.asarray(et_0, dtype=float), nan=0.0)
+    location = invoices["location"].to_numpy()
+    grass_area = invoices["grass_area"].to_numpy(dtype=float)
+    efficiency = scenarios["efficiency"].to_numpy(dtype=float)[:, np.newaxis]
+    threshold = scenarios["score_threshold"].to_numpy(dtype=float)[:, np.newaxis]
+    score = invoices["score"].to_numpy(dtype=float)
+
+    volumes = np.empty((len(scenarios), len(invoices)), dtype=np.float32)
+    # float64 bytes per invoice of the monthly sums plus the per-scenario needs.
+    row_bytes = 8 * (len(factors) * 12 + len(calendar_factors) + len(scenarios))
+    block_size = max(1, block_bytes // row_bytes)
+    order = np.argsort(location, kind="stable")
+    for first in range(0, len(invoices), block_size):
+        block = order[first : first + block_size]
+        block_locations, block_location = np.unique(
+            location[block], return_inverse=True
+        )
+
+        # Every invoice period is split at month boundaries; each segment then
+        # takes one lookup in a prefix-sum table per factor.
+        rows, months, segment_start, segment_end = interval.month_segments(
+            invoices["start_read_date"].to_numpy()[block],
+            invoices["end_read_date"].to_numpy()[block],
+        )
+        bins = rows * 12 + months.astype(int) % 12
+
+        # sums[k, m, i]: water need of invoice i in month-of-year m at the k-th factor.
+        sums = np.zeros((len(factors), 12, len(block)))
+        for k, factor in enumerate(factors):
+            if factor == 0:
+                continue
+            days, prefix = interval.build_prefix_sum(
+                dates, (et_0[block_locations] * factor / 1000).round(decimals=4)
+            )
+            segment_sums = interval.interval_sums(
+                days, prefix, segment_start, segment_end, rows=block_location[rows]
+            )
+            sums[k] = np.bincount(
+                bins, weights=segment_sums, minlength=len(block) * 12
+            ).reshape(-1, 12).T
+
+        need_m3 = np.zeros((len(calendar_factors), len(block)))
+        for month in range(12):
+            need_m3 += sums[calendar_factors[:, month], month]
+        del sums
+        np.round(need_m3, 4, out=need_m3)
+
+        # In place: scale each scenario's need per m² to the grass area and truncate.
+        water_need = need_m3[calendar_index]
+        water_need *= grass_area[block]
+        water_need /= efficiency
+        np.trunc(water_need, out=water_need)
+        water_need[score[block] <= threshold] = np.nan
+        volumes[:, block] = water_need
+    return volumes
+
+
+def summarize(scenarios, volumes, actual_volume):
+    """
+    Adds per-scenario totals to the scenario table.
+
+    Returns:
+      - Copy of scenarios with invoice_count, estimated_volume, actual_volume and
+        difference (actual - estimated) over the invoices each scenario assesses
+    """
+    assessed = ~np.isnan(volumes)
+    actual = np.nansum(
+        np.where(assessed, np.asarray(actual_volume, dtype=float), 0), axis=1
+    )
+    estimated = np.nansum(volumes, axis=1, dtype=float)
+    return scenarios.assign(
+        invoice_count=assessed.sum(axis=1),
+        estimated_volume=estimated,
+        actual_volume=actual,
+        difference=actual - estimated,
+    )
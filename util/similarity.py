@@ -1,46 +1,222 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 
-def best_matches(list1, list2):
+# Rows of list1 scored per block; bounds memory to one block of sparse products.
+CHUNK_SIZE = 1000
+
+# "word": TF-IDF over the raw words. "turkish": TF-IDF over character 3-grams of
+# the normalized names (see normalize_name), robust to spelling and spacing variants.
+MATCH_MODES = ("word", "turkish")
+
+# Dotted I pairs are folded the Turkish way before lowercasing; diacritics are then
+# dropped so "ŞÜKRAN" and "Sukran" compare equal.
+_TURKISH_CASE = str.maketrans({"I": "ı", "İ": "i"})
+_TURKISH_ASCII = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+
+# Dotted compounds rewritten before splitting into words.
+_PHRASES = {
+    r"\be\.\s*gut\b": "etimesgut",
+    r"\bk\.\s*oren\b": "kecioren",
+    r"\by\.\s*alan\b": "yesil alan",
+    r"\bt\.\s*c\.": " ",
+}
+# Abbreviations and suffix variants, after case and diacritic folding.
+ABBREVIATIONS = {
+    "bel": "belediyesi",
+    "bld": "belediyesi",
+    "belediye": "belediyesi",
+    "bsk": "baskanligi",
+    "bk": "baskanligi",
+    "baskanl": "baskanligi",
+    "mud": "mudurlugu",
+    "md": "mudurlugu",
+    "bah": "bahce",
+    "bahc": "bahce",
+    "sht": "sehit",
+    "sh": "sehit",
+    "cank": "cankaya",
+    "prk": "park",
+    "parki": "park",
+}
+# Words that every park name may or may not carry.
+_GENERIC_WORDS = {"park"}
+
+
+@lru_cache(maxsize=None)
+def normalize_name(name):
     """
-    For each string in list1, find the string in list2 with the highest cosine similarity.
-    The resulting DataFrame is sorted in descending order by the similarity score.
+    Normalizes a Turkish park name for matching.
 
-    Parameters:
-        list1 (list of str): List of strings.
-        list2 (list of str): Another list of strings.
+    Applies Turkish case folding (I/ı, İ/i), drops diacritics and year annotations
+    such as "(2017)", expands common abbreviations ("BEL.BŞK." -> "belediyesi
+    baskanligi") and drops the generic word "park"/"parkı". Results are memoized.
 
     Returns:
-        pd.DataFrame: A dataframe with columns 'name_1', 'name_2', and 'score'.
-                      Each row contains a string from list1, its best match from list2,
-                      and the cosine similarity score, sorted by score descending.
+        str: Lowercase ASCII words separated by single spaces.
     """
+    text = name.translate(_TURKISH_CASE).lower().translate(_TURKISH_ASCII)
+    text = re.sub(r"\(\s*\d{4}\s*\)", " ", text)
+    for pattern, replacement in _PHRASES.items():
+        text = re.sub(pattern, replacement, text)
+    words = (ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", text))
+    return " ".join(word for word in words if word not in _GENERIC_WORDS)
+
+
+def prepare_texts(texts, mode):
+    """Returns the texts as fed to the vectorizer of the given mode."""
+    if mode == "word":
+        return tuple(texts)
+    if mode == "turkish":
+        # Spaces are dropped so words split or merged by data entry still share n-grams.
+        return tuple(normalize_name(text).replace(" ", "") for text in texts)
+    raise ValueError(f"Unknown match mode {mode!r}; expected one of {MATCH_MODES}.")
+
+
+def make_vectorizer(mode, **kwargs):
+    """Returns an unfitted TfidfVectorizer for the given mode."""
+    if mode == "turkish":
+        return TfidfVectorizer(analyzer="char", ngram_range=(3, 3), **kwargs)
+    return TfidfVectorizer(**kwargs)
+
+
+def match_keys(names, mode):
+    """
+    Returns a key per name that is equal for names the matcher cannot tell apart.
+
+    Two names get the same key when the mode's vectorizer sees the same terms with
+    the same counts in them, e.g. "Duygu Parkı" and "Duygu Parkı (2018)" in
+    "turkish" mode; any name then scores the same against both.
+
+    Returns:
+        pd.Series: Keys (sorted term counts as tuples), indexed like names.
+    """
+    names = pd.Series(names).fillna("").astype(str)
+    analyzer = make_vectorizer(mode).build_analyzer()
+    texts = prepare_texts(names, mode)
+    return pd.Series(
+        [tuple(sorted(Counter(analyzer(text)).items())) for text in texts],
+        index=names.index,
+    )
+
+
+@lru_cache(maxsize=8)
+def _fit_vectors(texts1, texts2, mode):
+    """Fits TF-IDF for a pair of name tuples; memoized so repeated matches skip fitting."""
+    texts1 = prepare_texts(texts1, mode)
+    texts2 = prepare_texts(texts2, mode)
+    vectorizer = make_vectorizer(mode)
+
     # Combine both lists to build a common vocabulary for the vectorizer.
-    combined_texts = list1 + list2
+    combined_texts = texts1 + texts2
 
     # Initialize and fit the vectorizer.
-    vectorizer = TfidfVectorizer()
     tfidf_matrix = vectorizer.fit_transform(combined_texts)
 
     # Split the TF-IDF matrix back into two parts corresponding to list1 and list2.
-    tfidf_list1 = tfidf_matrix[: len(list1)]
-    tfidf_list2 = tfidf_matrix[len(list1) :]
+    return tfidf_matrix[: len(texts1)], tfidf_matrix[len(texts1) :]
+
+
+def _tfidf_vectors(list1, list2, mode="word"):
+    """Returns the L2-normalized sparse TF-IDF vectors of both lists."""
+    return _fit_vectors(tuple(list1), tuple(list2), mode)
 
-    # Compute the cosine similarity between each string in list1 and each string in list2.
-    similarity_matrix = cosine_similarity(tfidf_list1, tfidf_list2)
 
-    # For each string in list1, find the best matching string in list2.
-    best_match_indices = similarity_matrix.argmax(axis=1)
-    best_match_scores = similarity_matrix.max(axis=1)
+def top_k_per_row(block, k):
+    """
+    Selects the k largest entries of every row of a sparse score matrix.
+
+    Returns:
+      - Arrays (rows, cols, scores, ranks) of the kept entries, ordered by row and
+        descending score; ties keep the lowest column first
+    """
+    block = block.tocsr()
+    block.sum_duplicates()
+    row_ids = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+    order = np.lexsort((block.indices, -block.data, row_ids))
+    rows = row_ids[order]
+    # Sorting by row keeps each row's entries where CSR stored them.
+    ranks = np.arange(len(order)) - block.indptr[rows]
+    keep = ranks < k
+    return rows[keep], block.indices[order][keep], block.data[order][keep], ranks[keep]
+
+
+def top_k_matches(list1, list2, k=5, chunk_size=CHUNK_SIZE, mode="word"):
+    """
+    For each string in list1, find the k strings in list2 with the highest cosine similarity.
+
+    Similarities are computed as sparse products of TF-IDF vectors, chunk_size rows of
+    list1 at a time, so the full list1 × list2 matrix is never materialized. Pairs
+    sharing no term have zero similarity and are not returned.
+
+    Parameters:
+        list1 (list of str): List of strings.
+        list2 (list of str): Another list of strings.
+        k (int): Number of candidates kept per string of list1.
+        chunk_size (int): Number of list1 strings scored per block.
+        mode (str): Feature mode, one of MATCH_MODES (default "word").
+
+    Returns:
+        pd.DataFrame: A dataframe with columns 'name_1', 'name_2', 'score' and 'rank'
+                      (0 for the best candidate), sorted by score descending.
+    """
+    tfidf_list1, tfidf_list2 = _tfidf_vectors(list1, list2, mode)
+    tfidf_list2_t = tfidf_list2.T.tocsc()
+
+    rows, cols, scores, ranks = [], [], [], []
+    for start in range(0, len(list1), chunk_size):
+        block = tfidf_list1[start : start + chunk_size] @ tfidf_list2_t
+        block_rows, block_cols, block_scores, block_ranks = top_k_per_row(block, k)
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+        scores.append(block_scores)
+        ranks.append(block_ranks)
+
+    rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+    cols = np.concatenate(cols) if cols else np.array([], dtype=int)
+    df = pd.DataFrame(
+        {
+            "name_1": np.asarray(list1, dtype=object)[rows],
+            "name_2": np.asarray(list2, dtype=object)[cols],
+            "score": np.concatenate(scores) if scores else np.array([]),
+            "rank": np.concatenate(ranks) if ranks else np.array([], dtype=int),
+        }
+    )
+    df.sort_values("score", ascending=False, inplace=True, kind="stable")
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def best_matches(list1, list2, mode="word"):
+    """
+    For each string in list1, find the string in list2 with the highest cosine similarity.
+    The resulting DataFrame is sorted in descending order by the similarity score.
+
+    Parameters:
+        list1 (list of str): List of strings.
+        list2 (list of str): Another list of strings.
+        mode (str): Feature mode, one of MATCH_MODES (default "word").
+
+    Returns:
+        pd.DataFrame: A dataframe with columns 'name_1', 'name_2', and 'score'.
+                      Each row contains a string from list1, its best match from list2,
+                      and the cosine similarity score, sorted by score descending.
+    """
+    # Top-1 candidates from the blocked sparse matcher, in list1 order.
+    top_1 = top_k_matches(list1, list2, k=1, mode=mode).set_index("name_1")
+    top_1 = top_1[~top_1.index.duplicated()].reindex(list1)
 
-    # Create the dataframe.
+    # Strings sharing no term with list2 fall back to its first entry with score 0.
     df = pd.DataFrame(
         {
             "name_1": list1,
-            "name_2": [list2[idx] for idx in best_match_indices],
-            "score": best_match_scores,
+            "name_2": top_1["name_2"].fillna(list2[0]).to_numpy(),
+            "score": top_1["score"].fillna(0.0).to_numpy(),
         }
     )
 
@@ -0,0 +1,99 @@
+import os
+
+import pandas as pd
+
+
+def table_path(base_path):
+    """
+    Returns the file backing a table: the Parquet file if it exists, else the CSV.
+
+    Parameters:
+      - base_path: Path of the table without extension (e.g. "data/ca_invoice")
+    """
+    parquet_path = f"{base_path}.parquet"
+    if os.path.exists(parquet_path):
+        return parquet_path
+    return f"{base_path}.csv"
+
+
+def write_table(df, base_path, dates=(), categories=(), export_csv=False):
+    """
+    Writes a processed table as Parquet, with an optional CSV export next to it.
+
+    Parameters:
+      - df: DataFrame to write
+      - base_path: Path of the table without extension
+      - dates: Columns stored as datetime64
+      - categories: Columns stored as categoricals
+      - export_csv: Also write <base_path>.csv (default=False)
+    """
+    df = df.copy()
+    for column in dates:
+        df[column] = pd.to_datetime(df[column])
+    for column in categories:
+        df[column] = df[column].astype("category")
+
+    df.to_parquet(f"{base_path}.parquet", index=False)
+    if export_csv:
+        csv_df = df.copy()
+        for column in dates:
+            csv_df[column] = csv_df[column].dt.strftime("%Y-%m-%d")
+        csv_df.to_csv(f"{base_path}.csv", index=False)
+
+
+def write_partitioned_table(df, path, partition_col, dates=(), categories=()):
+    """
+    Writes a table as a Hive-style Parquet dataset with one folder per partition value.
+
+    Each partition is written to <path>/<partition_col>=<value>/part-0.parquet.
+    Partitions present in df replace the ones on disk; other partitions are kept,
+    so one job can refresh a subset of them. pd.read_parquet(path) reads the whole
+    dataset back with the partition column.
+
+    Parameters:
+      - df: DataFrame to write
+      - path: Dataset directory (e.g. "data/invoice_assessment")
+      - partition_col: Column to partition by (e.g. "district")
+      - dates: Columns stored as datetime64
+      - categories: Columns stored as categoricals
+    """
+    df = df.copy()
+    for column in dates:
+        df[column] = pd.to_datetime(df[column])
+    for column in categories:
+        df[column] = df[column].astype("category")
+
+    for value, partition in df.groupby(partition_col, observed=True, sort=False):
+        partition_dir = os.path.join(path, f"{partition_col}={value}")
+        os.makedirs(partition_dir, exist_ok=True)
+        for name in os.listdir(partition_dir):
+            os.remove(os.path.join(partition_dir, name))
+        partition.drop(columns=partition_col).to_parquet(
+            os.path.join(partition_dir, "part-0.parquet"), index=False
+        )
+
+
+def read_table(base_path, columns=None, dates=(), categories=()):
+    """
+    Reads a table written by write_table, falling back to its CSV export.
+
+    Parameters:
+      - base_path: Path of the table without extension
+      - columns: Columns to read (default=all)
+      - dates: Columns to parse as datetime64 when reading CSV
+      - categories: Columns to read as categoricals when reading CSV
+
+    Returns:
+      - DataFrame with the same dtypes whichever file backs the table
+    """
+    path = table_path(base_path)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+
+    return pd.read_csv(
+        path,
+        usecols=columns,
+        dtype={column: "category" for column in categories},
+        parse_dates=list(dates),
+        date_format="%Y-%m-%d",
+    )
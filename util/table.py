@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps, colors
+
+# Number of colours a gradient column is quantized to.
+GRADIENT_BINS = 64
+# Backgrounds darker than this relative luminance get light text, as in pandas'
+# Styler.background_gradient.
+TEXT_COLOR_THRESHOLD = 0.408
+
+
+def gradient_palette(cmap="coolwarm", bins=GRADIENT_BINS):
+    """
+    Returns the CSS of every colour bin of a colormap.
+
+    Returns:
+      - Array of bins + 1 CSS strings; the last one (no style) is for missing values
+    """
+    rgba = colormaps[cmap]((np.arange(bins) + 0.5) / bins)
+    # Relative luminance (https://www.w3.org/WAI/GL/wiki/Relative_luminance)
+    rgb = rgba[:, :3]
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+    text_colors = np.where(luminance < TEXT_COLOR_THRESHOLD, "#f1f1f1", "#000000")
+    css = [
+        f"background-color: {colors.rgb2hex(color)};color: {text};"
+        for color, text in zip(rgba, text_colors)
+    ]
+    return np.array(css + [""], dtype=object)
+
+
+def gradient_bins(df, columns, bins=GRADIENT_BINS):
+    """
+    Assigns every value of the gradient columns to a colour bin, column by column.
+
+    Each column is scaled between its own minimum and maximum over the whole
+    table, so a value gets the same colour on whichever page it is shown.
+
+    Returns:
+      - DataFrame of int bins (bins for missing values) with the given columns
+    """
+    values = df[columns].to_numpy(dtype=float, na_value=np.nan)
+    low = np.nanmin(values, axis=0, initial=np.inf, where=~np.isnan(values))
+    high = np.nanmax(values, axis=0, initial=-np.inf, where=~np.isnan(values))
+    span = np.where(high > low, high - low, 1)
+    scaled = np.nan_to_num((values - low) / span, nan=0)
+    codes = np.minimum((scaled * bins).astype(int), bins - 1)
+    codes[np.isnan(values)] = bins
+    return pd.DataFrame(codes, index=df.index, columns=columns)
+
+
+def sort_positions(df, column, ascending=True):
+    """Returns the row positions of df sorted by a column, missing values last."""
+    return (
+        df[column]
+        .reset_index(drop=True)
+        .sort_values(ascending=ascending, kind="stable", na_position="last")
+        .index.to_numpy()
+    )
+
+
+def page_count(n_rows, page_size):
+    """Returns the number of pages needed for n_rows (at least one)."""
+    return max(1, -(-n_rows // page_size))
+
+
+def table_page(df, positions, page, page_size, gradient_codes=None, palette=None):
+    """
+    Cuts one page out of a sorted table, with the CSS of its gradient cells.
+
+    Parameters:
+      - df: Table to page through
+      - positions: Row order returned by sort_positions
+      - page: 1-based page number
+      - page_size: Rows per page
+      - gradient_codes: Optional bins returned by gradient_bins for df
+      - palette: CSS per bin returned by gradient_palette
+
+    Returns:
+      - Tuple (page_df, styles) where styles is a DataFrame of CSS strings for the
+        gradient columns of page_df, or None without gradient_codes
+    """
+    rows = positions[(page - 1) * page_size : page * page_size]
+    page_df = df.iloc[rows]
+    if gradient_codes is None:
+        return page_df, None
+    codes = gradient_codes.to_numpy()[rows]
+    styles = pd.DataFrame(
+        palette[codes], index=page_df.index, columns=gradient_codes.columns
+    )
+    return page_df, styles
@@ -1,57 +1,282 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import altair as alt
-import requests
 from datetime import datetime, timedelta
 
+from util import http_client, perf
+
+
+# Set WEATHER_ARCHIVE_URL to query a stand-in server (e.g. in tests).
+ARCHIVE_URL = os.environ.get(
+    "WEATHER_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/archive"
+)
+DAILY_VARIABLES = [
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "windspeed_10m_max",
+    "relative_humidity_2m_max",
+    "shortwave_radiation_sum",
+]
+
+# Historical days never change, so fetched days are kept on disk and reused.
+# Set cache_dir=None to always query the archive.
+CACHE_DIR = "data/weather_cache"
+# Coordinates are rounded before querying so nearby points share a cache file.
+COORD_DECIMALS = 2
+# Locations closer than a grid cell share one weather series (degrees).
+GRID_RESOLUTION = 0.1
+# Long date ranges are requested in chunks of at most this many days.
+CHUNK_DAYS = 366
+# Archive requests in flight at once, and started per second, across all threads.
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 5
+
+_archive_lock = threading.Lock()
+_archive_session = None
+_archive_rate_limiter = None
+
+
+def _archive_client():
+    """Returns the shared (session, rate limiter) pair, creating it on first use."""
+    global _archive_session, _archive_rate_limiter
+    with _archive_lock:
+        if _archive_session is None:
+            _archive_session = http_client.make_session(pool_size=MAX_WORKERS)
+            _archive_rate_limiter = http_client.RateLimiter(REQUESTS_PER_SECOND)
+        return _archive_session, _archive_rate_limiter
+
 
 # Weather Data and Water Need Estimation Module
-def fetch_weather_data(lat, lon, start_date, end_date):
-    base_url = "https://archive-api.open-meteo.com/v1/archive"
+def _fetch_archive(lat, lon, start_date, end_date, variables):
+    """Queries the Open-Meteo archive and returns one row per day with the raw variables."""
     params = {
         "latitude": lat,
         "longitude": lon,
         "start_date": start_date.strftime("%Y-%m-%d"),
         "end_date": end_date.strftime("%Y-%m-%d"),
-        "daily": [
-            "temperature_2m_max",
-            "temperature_2m_min",
-            "windspeed_10m_max",
-            "relative_humidity_2m_max",
-            "shortwave_radiation_sum",
-        ],
+        "daily": list(variables),
         "timezone": "auto",
     }
-    response = requests.get(base_url, params=params)
-    response.raise_for_status()  # Raises HTTPError for bad responses
-    data = response.json()
+    session, rate_limiter = _archive_client()
+    data = http_client.get_json(
+        session, ARCHIVE_URL, params=params, rate_limiter=rate_limiter
+    )
 
     if "daily" not in data or not data["daily"]:
         raise ValueError(
             f"Weather data is unavailable for the selected date range and location. Response: {data}"
         )
 
-    df = pd.DataFrame(
-        {
-            "date": pd.date_range(start=start_date, end=end_date).date,
-            "tavg": (
-                np.array(data["daily"]["temperature_2m_max"])
-                + np.array(data["daily"]["temperature_2m_min"])
+    df = pd.DataFrame({var: data["daily"][var] for var in variables}, dtype=float)
+    df.insert(0, "date", pd.date_range(start=start_date, end=end_date))
+    return df
+
+
+def _cache_path(cache_dir, lat, lon, variables):
+    """Returns the Parquet file holding the cached days for a location and variable set."""
+    variable_key = hashlib.sha1(",".join(sorted(variables)).encode()).hexdigest()[:10]
+    return os.path.join(
+        cache_dir,
+        f"{lat:.{COORD_DECIMALS}f}_{lon:.{COORD_DECIMALS}f}_{variable_key}.parquet",
+    )
+
+
+def _missing_spans(cached_dates, start_date, end_date):
+    """Returns (start, end) pairs of consecutive days in the range that are not cached."""
+    requested = pd.date_range(start=start_date, end=end_date)
+    missing = requested[~requested.isin(cached_dates)]
+    if missing.empty:
+        return []
+    # A new span starts wherever the gap to the previous missing day exceeds one day.
+    breaks = np.flatnonzero(np.diff(missing.values) != np.timedelta64(1, "D")) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks - 1, [len(missing) - 1]))
+    return [(missing[i], missing[j]) for i, j in zip(starts, ends)]
+
+
+def _date_chunks(start_date, end_date, chunk_days=CHUNK_DAYS):
+    """Splits an inclusive date range into consecutive (start, end) chunks."""
+    starts = pd.date_range(start=start_date, end=end_date, freq=f"{chunk_days}D")
+    return [
+        (chunk_start, min(chunk_start + pd.Timedelta(days=chunk_days - 1), end_date))
+        for chunk_start in starts
+    ]
+
+
+def _update_cache(path, cached, fetched, variables):
+    """Merges fetched days into a location's cache file and returns all known days."""
+    complete = [df.dropna(subset=variables) for df in fetched]
+    updated = (
+        pd.concat([cached] + complete, ignore_index=True)
+        .drop_duplicates(subset="date", keep="last")
+        .sort_values("date", ignore_index=True)
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a partial cache.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    updated.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return pd.concat([cached] + fetched, ignore_index=True).drop_duplicates(
+        subset="date", keep="last"
+    )
+
+
+def fetch_daily_variables_many(
+    locations,
+    start_date,
+    end_date,
+    variables=DAILY_VARIABLES,
+    cache_dir=CACHE_DIR,
+    max_workers=MAX_WORKERS,
+):
+    """
+    Returns the raw daily archive variables for many locations, using the on-disk cache.
+
+    The days missing from each location's cache are split into chunks of at most
+    CHUNK_DAYS days, and the chunks of all locations are requested concurrently
+    over one pooled session, at most REQUESTS_PER_SECOND starting per second.
+    Failed requests are retried with backoff (see util/http_client.py). Chunks are
+    reassembled in date order and merged into the cache files. Days the archive
+    has no values for yet (the most recent days) are returned but never cached,
+    so they are fetched again later.
+
+    Parameters:
+      - locations: (lat, lon) pairs
+      - start_date: Start date (datetime object)
+      - end_date: End date (datetime object)
+      - variables: Open-Meteo daily variable names (default=DAILY_VARIABLES)
+      - cache_dir: Directory of the Parquet cache, or None to disable caching
+      - max_workers: Concurrent requests (default=MAX_WORKERS)
+
+    Returns:
+      - List with one DataFrame per location, each with a datetime64 date column
+        followed by one column per variable
+    """
+    start_date = pd.Timestamp(start_date).normalize()
+    end_date = pd.Timestamp(end_date).normalize()
+    variables = list(variables)
+    locations = [
+        (round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS))
+        for lat, lon in locations
+    ]
+    unique_locations = list(dict.fromkeys(locations))
+
+    cached = {}
+    jobs = []
+    for location in unique_locations:
+        path = cache_dir and _cache_path(cache_dir, *location, variables)
+        if path and os.path.exists(path):
+            cached[location] = pd.read_parquet(path)
+        else:
+            cached[location] = pd.DataFrame({"date": pd.DatetimeIndex([])})
+        for span_start, span_end in _missing_spans(
+            cached[location]["date"], start_date, end_date
+        ):
+            jobs.extend(
+                (location, chunk_start, chunk_end)
+                for chunk_start, chunk_end in _date_chunks(span_start, span_end)
+            )
+
+    n_workers = max(1, min(max_workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # map keeps the job order: each location's chunks come back in date order.
+        results = executor.map(
+            lambda job: _fetch_archive(*job[0], job[1], job[2], variables), jobs
+        )
+        fetched = {location: [] for location in unique_locations}
+        for (location, _, _), df in zip(jobs, results):
+            fetched[location].append(df)
+
+    for location in unique_locations:
+        if not fetched[location]:
+            continue
+        if cache_dir is None:
+            cached[location] = pd.concat(fetched[location], ignore_index=True)
+        else:
+            cached[location] = _update_cache(
+                _cache_path(cache_dir, *location, variables),
+                cached[location],
+                fetched[location],
+                variables,
             )
-            / 2,
-            "wspd": data["daily"]["windspeed_10m_max"],
-            "rhum": data["daily"]["relative_humidity_2m_max"],
-            "rad": data["daily"]["shortwave_radiation_sum"],
+
+    results = {}
+    for location, df in cached.items():
+        in_range = (df["date"] >= start_date) & (df["date"] <= end_date)
+        results[location] = df[in_range].sort_values("date", ignore_index=True)
+    return [results[location] for location in locations]
+
+
+def fetch_daily_variables(
+    lat, lon, start_date, end_date, variables=DAILY_VARIABLES, cache_dir=CACHE_DIR
+):
+    """
+    Returns the raw daily archive variables for a location, using the on-disk cache.
+
+    Only the date spans that are not cached yet are requested from the archive
+    (see fetch_daily_variables_many).
+
+    Parameters:
+      - lat: Latitude of the location
+      - lon: Longitude of the location
+      - start_date: Start date (datetime object)
+      - end_date: End date (datetime object)
+      - variables: Open-Meteo daily variable names (default=DAILY_VARIABLES)
+      - cache_dir: Directory of the Parquet cache, or None to disable caching
+
+    Returns:
+      - DataFrame with a datetime64 date column followed by one column per variable
+    """
+    return fetch_daily_variables_many(
+        [(lat, lon)], start_date, end_date, variables, cache_dir=cache_dir
+    )[0]
+
+
+def _weather_frame(daily):
+    """Derives the tavg, wspd, rhum and rad columns from the raw daily variables."""
+    return pd.DataFrame(
+        {
+            "date": daily["date"].dt.date,
+            "tavg": (daily["temperature_2m_max"] + daily["temperature_2m_min"]) / 2,
+            "wspd": daily["windspeed_10m_max"],
+            "rhum": daily["relative_humidity_2m_max"],
+            "rad": daily["shortwave_radiation_sum"],
         }
     )
-    return df
+
+
+@perf.timed("weather.fetch_weather_data")
+def fetch_weather_data(lat, lon, start_date, end_date, cache_dir=CACHE_DIR):
+    daily = fetch_daily_variables(
+        lat, lon, start_date, end_date, DAILY_VARIABLES, cache_dir=cache_dir
+    )
+    return _weather_frame(daily)
+
+
+@perf.timed("weather.fetch_weather_data_many")
+def fetch_weather_data_many(locations, start_date, end_date, cache_dir=CACHE_DIR):
+    """Returns fetch_weather_data for many (lat, lon) pairs, fetched concurrently."""
+    return [
+        _weather_frame(daily)
+        for daily in fetch_daily_variables_many(
+            locations, start_date, end_date, DAILY_VARIABLES, cache_dir=cache_dir
+        )
+    ]
 
 
 def compute_penman_monteith(temp, wind, rh, rad, elevation=0):
     """
     Computes the reference evapotranspiration (ET0) using the Penman–Monteith equation.
 
+    All inputs may be scalars or NumPy arrays; arrays are broadcast against each
+    other, so whole weather columns (or location × day grids) are computed at once.
+
     Parameters:
       - temp: Average temperature (°C)
       - wind: Wind speed at 10 m (m/s)
@@ -60,19 +285,23 @@ def compute_penman_monteith(temp, wind, rh, rad, elevation=0):
       - elevation: Elevation in meters (default=0)
 
     Returns:
-      - ET0 in mm/day
+      - ET0 in mm/day, with the same shape as the broadcast inputs
     """
+    temp = np.asarray(temp, dtype=float)
+    wind = np.asarray(wind, dtype=float)
+    rh = np.asarray(rh, dtype=float)
+    rad = np.asarray(rad, dtype=float)
+    elevation = np.asarray(elevation, dtype=float)
+
     temp_k = temp + 273.15
-    delta = (4098 * (0.6108 * np.exp((17.27 * temp) / (temp + 237.3)))) / (
-        (temp + 237.3) ** 2
-    )
+    e_s = 0.6108 * np.exp((17.27 * temp) / (temp + 237.3))
+    delta = (4098 * e_s) / ((temp + 237.3) ** 2)
 
     # Adjust atmospheric pressure based on elevation.
     # Standard sea-level pressure is ~101.3 kPa.
     P = 101.3 * ((293 - 0.0065 * elevation) / 293) ** 5.26  # in kPa
     gamma = 0.665 * 0.001 * P  # Psychrometric constant in kPa/°C
 
-    e_s = 0.6108 * np.exp((17.27 * temp) / (temp + 237.3))
     e_a = (rh / 100) * e_s
     # rad is assumed to be in MJ/m²/day (no conversion needed)
     rad_mj = rad
@@ -80,11 +309,11 @@ def compute_penman_monteith(temp, wind, rh, rad, elevation=0):
     et_0 = (0.408 * delta * rad_mj + gamma * (900 / temp_k) * wind * (e_s - e_a)) / (
         delta + gamma * (1 + 0.34 * wind)
     )
-    return max(et_0, 0)
+    return np.maximum(et_0, 0)
 
 
 def estimate_water_needs(
-    lat, lon, start_date, end_date, park_area, kc=0.8, elevation=0
+    lat, lon, start_date, end_date, park_area, kc=0.8, elevation=0, cache_dir=CACHE_DIR
 ):
     """
     Estimates the water needs for a given park area over a specified date range.
@@ -97,17 +326,21 @@ def estimate_water_needs(
       - park_area: Area of the park in m²
       - kc: Crop coefficient (default=0.8)
       - elevation: Elevation in meters (default=0)
+      - cache_dir: Weather cache directory, or None to disable caching
 
     Returns:
       - DataFrame with columns: date, ET0, ETc, and Water_Need_m3
     """
-    weather_data = fetch_weather_data(lat, lon, start_date, end_date)
+    weather_data = fetch_weather_data(
+        lat, lon, start_date, end_date, cache_dir=cache_dir
+    )
 
-    weather_data["ET0"] = weather_data.apply(
-        lambda row: compute_penman_monteith(
-            row["tavg"], row["wspd"], row["rhum"], row["rad"], elevation
-        ),
-        axis=1,
+    weather_data["ET0"] = compute_penman_monteith(
+        weather_data["tavg"].to_numpy(),
+        weather_data["wspd"].to_numpy(),
+        weather_data["rhum"].to_numpy(),
+        weather_data["rad"].to_numpy(),
+        elevation,
     )
     weather_data["ETc"] = weather_data["ET0"] * kc
     weather_data["water_need_m3"] = (weather_data["ETc"] * park_area / 1000).round(
@@ -116,6 +349,128 @@ def estimate_water_needs(
     return weather_data[["date", "ET0", "ETc", "water_need_m3"]]
 
 
+def snap_to_grid(lat, lon, resolution=GRID_RESOLUTION):
+    """Snaps coordinates to the nearest weather grid cell centre."""
+    lat = np.round(np.round(np.asarray(lat, dtype=float) / resolution) * resolution, 6)
+    lon = np.round(np.round(np.asarray(lon, dtype=float) / resolution) * resolution, 6)
+    return lat, lon
+
+
+def prefetch_grid_weather(
+    lats,
+    lons,
+    start_date,
+    end_date,
+    grid_resolution=GRID_RESOLUTION,
+    cache_dir=CACHE_DIR,
+):
+    """
+    Fills the weather cache for the grid cells of the given locations.
+
+    Used before starting parallel workers so each grid cell is queried once and
+    the workers read the shared cache instead of calling the API themselves.
+
+    Returns:
+      - Number of distinct grid cells fetched
+    """
+    cell_lat, cell_lon = snap_to_grid(lats, lons, grid_resolution)
+    cells = pd.DataFrame({"lat": cell_lat, "lon": cell_lon}).drop_duplicates()
+    fetch_weather_data_many(
+        list(cells.itertuples(index=False, name=None)),
+        start_date,
+        end_date,
+        cache_dir=cache_dir,
+    )
+    return len(cells)
+
+
+def fetch_grid_weather(
+    lats,
+    lons,
+    elevations,
+    start_date,
+    end_date,
+    grid_resolution=GRID_RESOLUTION,
+    cache_dir=CACHE_DIR,
+):
+    """
+    Fetches the daily weather of many locations, once per weather grid cell.
+
+    Locations are snapped to the weather grid and deduplicated, so parks sharing a
+    grid cell (and elevation) share a single weather series and a single row of the
+    result.
+
+    Parameters:
+      - lats: Latitudes of the locations
+      - lons: Longitudes of the locations
+      - elevations: Elevations in meters (scalar or one per location)
+      - start_date: Start date (datetime object)
+      - end_date: End date (datetime object)
+      - grid_resolution: Weather grid cell size in degrees (default=GRID_RESOLUTION)
+      - cache_dir: Weather cache directory, or None to disable caching
+
+    Returns:
+      - Dict with location_index (maps each input location to a row), elevation
+        (one per row), dates (datetime64 days) and tavg, wspd, rhum and rad arrays
+        of shape (n_unique_locations, n_days)
+    """
+    cell_lat, cell_lon = snap_to_grid(lats, lons, grid_resolution)
+    elevations = np.broadcast_to(np.asarray(elevations, dtype=float), cell_lat.shape)
+    locations = pd.DataFrame({"lat": cell_lat, "lon": cell_lon, "elevation": elevations})
+    # Groups are numbered in order of first appearance, matching drop_duplicates.
+    location_index = locations.groupby(
+        ["lat", "lon", "elevation"], sort=False
+    ).ngroup().to_numpy()
+    locations = locations.drop_duplicates(ignore_index=True)
+    cell_index = locations.groupby(["lat", "lon"], sort=False).ngroup().to_numpy()
+    cells = locations[["lat", "lon"]].drop_duplicates()
+
+    dates = pd.date_range(start=start_date, end=end_date)
+    # One weather series (cache read or concurrent queries) per grid cell, stacked
+    # into cell × day arrays.
+    cell_weather = [
+        df.assign(date=lambda df: pd.to_datetime(df["date"]))
+        .set_index("date")
+        .reindex(dates)
+        for df in fetch_weather_data_many(
+            list(cells.itertuples(index=False, name=None)),
+            dates[0],
+            dates[-1],
+            cache_dir=cache_dir,
+        )
+    ]
+    grid_weather = {
+        "location_index": location_index,
+        "elevation": locations["elevation"].to_numpy(),
+        "dates": dates.to_numpy().astype("datetime64[D]"),
+    }
+    for var in ["tavg", "wspd", "rhum", "rad"]:
+        # Without any location (e.g. no park matched) the arrays have no rows.
+        grid_weather[var] = np.stack(
+            [df[var].to_numpy() for df in cell_weather]
+            or [np.empty(len(dates))]
+        )[cell_index]
+    return grid_weather
+
+
+def grid_et0(grid_weather):
+    """
+    Computes the daily ET0 from weather returned by fetch_grid_weather.
+
+    ET0 is computed for all rows at once on the location × day grid.
+
+    Returns:
+      - Array of shape (n_unique_locations, n_days) in mm
+    """
+    return compute_penman_monteith(
+        grid_weather["tavg"],
+        grid_weather["wspd"],
+        grid_weather["rhum"],
+        grid_weather["rad"],
+        grid_weather["elevation"][:, np.newaxis],
+    )
+
+
 if __name__ == "__main__":
     lat, lon = 39.9, 32.85  # Ankara, Turkey
     start_date = datetime(2024, 8, 1)